@@ -1,121 +1,65 @@
 import json
 import os
+import sys
 import time
-import requests
 import streamlit as st
 from dotenv import load_dotenv
 
+# streamlit only puts app/ on sys.path; shared helpers live under services/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
 load_dotenv()
 
-PAYMENTS_URL = os.getenv("PAYMENTS_URL", "http://payments-service:8001")
-WHATSAPP_URL = os.getenv("WHATSAPP_URL", "http://whatsapp-service:8002")
-AUDIT_URL = os.getenv("AUDIT_URL", "http://audit-service:8003")
+# services.client reads DEPLOY_MODE and the service URLs at import time
+from services import client  # noqa: E402
+from services.planner import PLANNER_SYSTEM, parse_plan  # noqa: E402
+from services.resilience import LLM_TIMEOUT_SECONDS, deadline  # noqa: E402
+from services.tracing import span  # noqa: E402
 
-LLM_URL = os.getenv("LLM_URL", "http://llm:11434")
 LLM_MODEL = os.getenv("LLM_MODEL", "llama3")
 
 
 def llm_chat(system_prompt: str, user_prompt: str) -> str:
     """Call local Llama (Ollama-compatible) chat endpoint and return assistant text."""
-    resp = requests.post(
-        f"{LLM_URL}/api/chat",
-        json={
-            "model": LLM_MODEL,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-        },
-        timeout=60,
+    data = client.chat(
+        LLM_MODEL,
+        [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ],
+        timeout=LLM_TIMEOUT_SECONDS,
     )
-    resp.raise_for_status()
-    data = resp.json()
     return data["message"]["content"]
 
 
-def tool_get_payment_status(flat_no: str, month_year: str) -> dict:
-    resp = requests.get(
-        f"{PAYMENTS_URL}/get_payment_status",
-        params={"flat_no": flat_no, "month_year": month_year},
-        timeout=5,
-    )
-    if resp.status_code == 404:
+def tool_get_payment_status(flat_no: str, month_year: str, society_id: str | None = None) -> dict:
+    payment = client.get_payment_status(flat_no, month_year, society_id, timeout=5)
+    if payment is None:
         return {"error": "not_found"}
-    resp.raise_for_status()
-    return resp.json()
+    return payment
 
 
 def tool_send_whatsapp_reminder(flat_no: str, month_year: str) -> dict:
-    resp = requests.post(
-        f"{WHATSAPP_URL}/send_reminder",
-        json={"flat_no": flat_no, "month_year": month_year},
-        timeout=5,
-    )
-    resp.raise_for_status()
-    return resp.json()
-
-
-def tool_log_event(event_type: str, flat_no: str, month_year: str, details: dict) -> dict:
-    resp = requests.post(
-        f"{AUDIT_URL}/log_event",
-        json={
-            "event_type": event_type,
-            "flat_no": flat_no,
-            "month_year": month_year,
-            "details": details,
-        },
-        timeout=5,
-    )
-    resp.raise_for_status()
-    return resp.json()
-
-
-def tool_add_flat(flat_no: str, owner_name: str | None, phone_number: str | None, whatsapp_number: str | None) -> dict:
-    resp = requests.post(
-        f"{PAYMENTS_URL}/add_flat",
-        json={
-            "flat_no": flat_no,
-            "owner_name": owner_name,
-            "phone_number": phone_number,
-            "whatsapp_number": whatsapp_number,
-        },
-        timeout=5,
-    )
-    resp.raise_for_status()
-    return resp.json()
-
+    return client.send_reminder(flat_no, month_year, timeout=5)
 
-def tool_list_flats() -> list[dict]:
-    resp = requests.get(f"{PAYMENTS_URL}/list_flats", timeout=5)
-    resp.raise_for_status()
-    return resp.json()
 
+def tool_log_event(event_type: str, flat_no: str, month_year: str, details: dict, society_id: str | None = None) -> dict:
+    return client.log_event(event_type, flat_no, month_year, details, society_id, timeout=5)
 
-PLANNER_SYSTEM = """
-You are MaintenancePlanner, an assistant that plans what to do for society maintenance.
 
-You MUST output ONLY a single JSON object, nothing else.
-No explanation, no backticks, no extra text.
+def tool_add_flat(
+    flat_no: str,
+    owner_name: str | None,
+    phone_number: str | None,
+    whatsapp_number: str | None,
+    society_id: str | None = None,
+) -> dict:
+    return client.add_flat(flat_no, owner_name, phone_number, whatsapp_number, society_id, timeout=5)
 
-The JSON format MUST be:
-{
-  "action": "CHECK_ONLY" or "CHECK_AND_REMIND" or "ADD_FLAT",
-  "flat_no": "C-101",
-  "month_year": "2025-12",
-  "owner_name": "Optional when adding",
-  "phone_number": "Optional when adding",
-  "whatsapp_number": "Optional when adding"
-}
 
-- action:
-  - "CHECK_ONLY": Just check payment status and report it.
-  - "CHECK_AND_REMIND": Check status, and if unpaid, send a reminder and log it.
-  - "ADD_FLAT": Create or update a flat record with owner and phone details.
+def tool_list_flats(society_id: str | None = None) -> list[dict]:
+    return client.list_flats(society_id, timeout=5)
 
-If user does not specify month/year, assume current month-year (e.g., "2025-12") or pick a reasonable guess.
-Try to extract flat number from text like "C-101", "B-302", etc.
-If user wants to add a flat, include any provided owner/phone numbers; duplicates should be treated as updates.
-"""
 
 EXPLAINER_SYSTEM = """
 You are MaintenanceExplainer.
@@ -130,14 +74,12 @@ Explain clearly in simple English what happened.
 
 
 def plan_action(user_message: str) -> dict:
-    raw = llm_chat(PLANNER_SYSTEM, user_message)
+    # bounded by LLM_TIMEOUT_SECONDS, not by the tools' request deadline
     try:
-        start = raw.find("{")
-        end = raw.rfind("}")
-        json_str = raw[start : end + 1]
-        return json.loads(json_str)
-    except Exception as ex:
-        return {"error": f"Failed to parse planner output: {ex}", "raw": raw}
+        raw = llm_chat(PLANNER_SYSTEM, user_message)
+    except client.ServiceError as ex:
+        return {"error": f"Planner unavailable: {ex}", "raw": ""}
+    return parse_plan(raw)
 
 
 def explain_result(
@@ -178,6 +120,9 @@ def explain_result(
 
 st.set_page_config(page_title="Maintenance Agentic Demo", page_icon="MA")
 
+# every tool call below is scoped to this society (tenant)
+society_id = st.sidebar.text_input("Society", value=os.getenv("DEFAULT_SOCIETY_ID", "default")).strip() or None
+
 st.title("Maintenance Agent (Local Docker Demo)")
 st.write("Example: `Check if C-101 has paid for 2025-12. If not, send WhatsApp reminder.`")
 
@@ -216,7 +161,7 @@ user_input = st.text_input("Your message:", key="user_input")
 
 ask_clicked = st.button("Ask Agent")
 if ask_clicked and st.session_state["user_input"].strip():
-    with st.spinner("Thinking..."):
+    with st.spinner("Thinking..."), span("ui.ask_agent", service="app") as trace:
         # small pause for a smoother perceived response/typing effect
         time.sleep(0.4)
         plan = plan_action(st.session_state["user_input"].strip())
@@ -233,28 +178,33 @@ if ask_clicked and st.session_state["user_input"].strip():
             log_result = None
             add_flat_result = None
 
-            if action == "ADD_FLAT":
-                add_flat_result = tool_add_flat(
-                    flat_no=flat_no,
-                    owner_name=plan.get("owner_name"),
-                    phone_number=plan.get("phone_number"),
-                    whatsapp_number=plan.get("whatsapp_number"),
-                )
-            else:
-                payment = tool_get_payment_status(flat_no, month_year)
-                if (
-                    action == "CHECK_AND_REMIND"
-                    and isinstance(payment, dict)
-                    and not payment.get("error")
-                    and payment.get("is_paid") is False
-                ):
-                    reminder_result = tool_send_whatsapp_reminder(flat_no, month_year)
-                    log_result = tool_log_event(
-                        event_type="MAINTENANCE_REMINDER_SENT",
+            # the tool calls share one request deadline; the LLM calls around
+            # them have their own timeout, and the explainer a local fallback
+            with deadline():
+                if action == "ADD_FLAT":
+                    add_flat_result = tool_add_flat(
                         flat_no=flat_no,
-                        month_year=month_year,
-                        details={"reminder": reminder_result},
+                        owner_name=plan.get("owner_name"),
+                        phone_number=plan.get("phone_number"),
+                        whatsapp_number=plan.get("whatsapp_number"),
+                        society_id=society_id,
                     )
+                else:
+                    payment = tool_get_payment_status(flat_no, month_year, society_id)
+                    if (
+                        action == "CHECK_AND_REMIND"
+                        and isinstance(payment, dict)
+                        and not payment.get("error")
+                        and payment.get("is_paid") is False
+                    ):
+                        reminder_result = tool_send_whatsapp_reminder(flat_no, month_year)
+                        log_result = tool_log_event(
+                            event_type="MAINTENANCE_REMINDER_SENT",
+                            flat_no=flat_no,
+                            month_year=month_year,
+                            details={"reminder": reminder_result},
+                            society_id=society_id,
+                        )
 
             explanation = explain_result(
                 st.session_state["user_input"].strip(),
@@ -267,6 +217,7 @@ if ask_clicked and st.session_state["user_input"].strip():
 
             st.markdown("### Agent Response")
             st.write(explanation)
+            st.caption(f"Request ID: {trace['trace_id']}")
 
             st.markdown("### Debug Info (Plan)")
             st.json(plan)
@@ -297,19 +248,27 @@ with st.form("manual_flat_form"):
     submitted = st.form_submit_button("Add / Update Flat")
     if submitted:
         try:
-            result = tool_add_flat(
-                flat_no=manual_flat_no,
-                owner_name=manual_owner,
-                phone_number=manual_phone,
-                whatsapp_number=manual_whatsapp,
-            )
+            with span("ui.manual_add_flat", service="app"):
+                result = tool_add_flat(
+                    flat_no=manual_flat_no,
+                    owner_name=manual_owner,
+                    phone_number=manual_phone,
+                    whatsapp_number=manual_whatsapp,
+                    society_id=society_id,
+                )
             st.success(f"Saved flat {result.get('flat_no')} (id {result.get('flat_id')}).")
         except Exception as ex:
             st.error(f"Failed to add flat: {ex}")
 
 if st.button("Refresh flat list"):
     try:
-        flats = tool_list_flats()
+        with span("ui.refresh_flats", service="app"):
+            flats = tool_list_flats(society_id)
         st.json(flats)
     except Exception as ex:
         st.error(f"Failed to load flats: {ex}")
+
+with st.sidebar:
+    st.markdown("### Service health")
+    st.caption("Circuit breakers for calls made from this app.")
+    st.json(client.breaker_states())
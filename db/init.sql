@@ -1,11 +1,46 @@
+-- Every row belongs to a society (tenant). Each shard database runs this same
+-- schema and holds the societies the shard map routes to it. society_id has
+-- no SQL default: the services always write it (DEFAULT_SOCIETY_ID decides
+-- which society a request without one goes to).
 CREATE TABLE IF NOT EXISTS flats (
     flat_id SERIAL PRIMARY KEY,
-    flat_no VARCHAR(10) NOT NULL UNIQUE,
+    society_id VARCHAR(50) NOT NULL,
+    flat_no VARCHAR(10) NOT NULL,
     owner_name VARCHAR(100),
     phone_number VARCHAR(20),
-    whatsapp_number VARCHAR(20)
+    whatsapp_number VARCHAR(20),
+    UNIQUE (society_id, flat_no)
 );
 
+-- Flat/owner search: trigram indexes back fuzzy and ILIKE lookups,
+-- and every change is announced so payments_service can keep its
+-- in-memory prefix index warm (LISTEN flats_changed).
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS flats_flat_no_trgm ON flats USING gin (flat_no gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS flats_owner_name_trgm ON flats USING gin (owner_name gin_trgm_ops);
+-- flat numbers are also matched without the dash ("c101" finds "C-101")
+CREATE INDEX IF NOT EXISTS flats_flat_no_nodash_trgm ON flats USING gin ((replace(flat_no, '-', '')) gin_trgm_ops);
+
+CREATE OR REPLACE FUNCTION notify_flats_changed() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('flats_changed', json_build_object('society_id', OLD.society_id, 'flat_no', OLD.flat_no)::text);
+        RETURN OLD;
+    END IF;
+    IF TG_OP = 'UPDATE' AND (OLD.society_id, OLD.flat_no) IS DISTINCT FROM (NEW.society_id, NEW.flat_no) THEN
+        PERFORM pg_notify('flats_changed', json_build_object('society_id', OLD.society_id, 'flat_no', OLD.flat_no)::text);
+    END IF;
+    PERFORM pg_notify('flats_changed', json_build_object('society_id', NEW.society_id, 'flat_no', NEW.flat_no)::text);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS flats_changed ON flats;
+CREATE TRIGGER flats_changed
+AFTER INSERT OR UPDATE OR DELETE ON flats
+FOR EACH ROW EXECUTE FUNCTION notify_flats_changed();
+
 CREATE TABLE IF NOT EXISTS maintenance_payments (
     id SERIAL PRIMARY KEY,
     flat_id INT NOT NULL REFERENCES flats(flat_id),
@@ -14,8 +49,11 @@ CREATE TABLE IF NOT EXISTS maintenance_payments (
     paid_on TIMESTAMP NULL
 );
 
+CREATE INDEX IF NOT EXISTS maintenance_payments_month ON maintenance_payments (month_year);
+
 CREATE TABLE IF NOT EXISTS audit_logs (
     log_id SERIAL PRIMARY KEY,
+    society_id VARCHAR(50) NOT NULL,
     event_type VARCHAR(100) NOT NULL,
     flat_id INT NOT NULL REFERENCES flats(flat_id),
     month_year VARCHAR(7) NOT NULL,
@@ -23,21 +61,24 @@ CREATE TABLE IF NOT EXISTS audit_logs (
     created_at TIMESTAMP NOT NULL DEFAULT NOW()
 );
 
--- Sample flats
-INSERT INTO flats (flat_no, owner_name, phone_number, whatsapp_number)
+CREATE INDEX IF NOT EXISTS audit_logs_society_month ON audit_logs (society_id, month_year);
+
+-- Sample flats, in society 'default' (DEFAULT_SOCIETY_ID's default; if you
+-- change that variable, change it here too or the samples won't be visible)
+INSERT INTO flats (society_id, flat_no, owner_name, phone_number, whatsapp_number)
 VALUES
-  ('C-101', 'Test Owner 1', '+910000000001', '+910000000001'),
-  ('B-302', 'Test Owner 2', '+910000000002', '+910000000002')
-ON CONFLICT (flat_no) DO NOTHING;
+  ('default', 'C-101', 'Test Owner 1', '+910000000001', '+910000000001'),
+  ('default', 'B-302', 'Test Owner 2', '+910000000002', '+910000000002')
+ON CONFLICT (society_id, flat_no) DO NOTHING;
 
 -- B-302 has paid Dec 2025
 INSERT INTO maintenance_payments (flat_id, month_year, is_paid, paid_on)
 SELECT flat_id, '2025-12', TRUE, NOW()
-FROM flats WHERE flat_no = 'B-302'
+FROM flats WHERE society_id = 'default' AND flat_no = 'B-302'
 ON CONFLICT DO NOTHING;
 
 -- C-101 has NOT paid Dec 2025
 INSERT INTO maintenance_payments (flat_id, month_year, is_paid, paid_on)
 SELECT flat_id, '2025-12', FALSE, NULL
-FROM flats WHERE flat_no = 'C-101'
+FROM flats WHERE society_id = 'default' AND flat_no = 'C-101'
 ON CONFLICT DO NOTHING;
@@ -0,0 +1,72 @@
+-- Brings a database created from an older db/init.sql up to the current
+-- schema. Postgres only runs init.sql on an empty data volume, so existing
+-- installs need this. It is idempotent; run it on every shard:
+--
+--   docker compose exec -T db psql -U maintuser -d maintdb -v ON_ERROR_STOP=1 \
+--       -v society="${DEFAULT_SOCIETY_ID:-default}" < db/migrate.sql
+--
+-- `society` is the society that rows from before societies existed move into;
+-- it should match DEFAULT_SOCIETY_ID (default 'default').
+
+\if :{?society}
+\else
+\set society default
+\endif
+
+BEGIN;
+
+-- Societies: every flat and audit event belongs to one.
+ALTER TABLE flats ADD COLUMN IF NOT EXISTS society_id VARCHAR(50);
+UPDATE flats SET society_id = :'society' WHERE society_id IS NULL;
+ALTER TABLE flats ALTER COLUMN society_id SET NOT NULL, ALTER COLUMN society_id DROP DEFAULT;
+
+-- flat numbers are unique per society, not globally
+ALTER TABLE flats DROP CONSTRAINT IF EXISTS flats_flat_no_key;
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_constraint
+        WHERE conrelid = 'flats'::regclass AND conname = 'flats_society_id_flat_no_key'
+    ) THEN
+        ALTER TABLE flats ADD CONSTRAINT flats_society_id_flat_no_key UNIQUE (society_id, flat_no);
+    END IF;
+END $$;
+
+ALTER TABLE audit_logs ADD COLUMN IF NOT EXISTS society_id VARCHAR(50);
+UPDATE audit_logs a SET society_id = f.society_id
+FROM flats f
+WHERE f.flat_id = a.flat_id AND a.society_id IS NULL;
+ALTER TABLE audit_logs ALTER COLUMN society_id SET NOT NULL, ALTER COLUMN society_id DROP DEFAULT;
+
+CREATE INDEX IF NOT EXISTS maintenance_payments_month ON maintenance_payments (month_year);
+CREATE INDEX IF NOT EXISTS audit_logs_society_month ON audit_logs (society_id, month_year);
+
+-- Flat/owner search: pg_trgm for fuzzy matching, and the trigger that keeps
+-- payments_service's in-memory prefix index in sync (LISTEN flats_changed).
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS flats_flat_no_trgm ON flats USING gin (flat_no gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS flats_owner_name_trgm ON flats USING gin (owner_name gin_trgm_ops);
+-- flat numbers are also matched without the dash ("c101" finds "C-101")
+CREATE INDEX IF NOT EXISTS flats_flat_no_nodash_trgm ON flats USING gin ((replace(flat_no, '-', '')) gin_trgm_ops);
+
+CREATE OR REPLACE FUNCTION notify_flats_changed() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('flats_changed', json_build_object('society_id', OLD.society_id, 'flat_no', OLD.flat_no)::text);
+        RETURN OLD;
+    END IF;
+    IF TG_OP = 'UPDATE' AND (OLD.society_id, OLD.flat_no) IS DISTINCT FROM (NEW.society_id, NEW.flat_no) THEN
+        PERFORM pg_notify('flats_changed', json_build_object('society_id', OLD.society_id, 'flat_no', OLD.flat_no)::text);
+    END IF;
+    PERFORM pg_notify('flats_changed', json_build_object('society_id', NEW.society_id, 'flat_no', NEW.flat_no)::text);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS flats_changed ON flats;
+CREATE TRIGGER flats_changed
+AFTER INSERT OR UPDATE OR DELETE ON flats
+FOR EACH ROW EXECUTE FUNCTION notify_flats_changed();
+
+COMMIT;
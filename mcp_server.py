@@ -1,136 +1,129 @@
 import os
 from datetime import datetime
-import requests
 from fastmcp import FastMCP
 
-PAYMENTS_URL = os.getenv("PAYMENTS_URL", "http://payments-service:8001")
-WHATSAPP_URL = os.getenv("WHATSAPP_URL", "http://whatsapp-service:8002")
-AUDIT_URL = os.getenv("AUDIT_URL", "http://audit-service:8003")
-LLM_URL = os.getenv("LLM_URL", "http://llm:11434")
+from services import client
+from services.resilience import LLM_TIMEOUT_SECONDS, deadline, step
+from services.tracing import span
+
 LLM_MODEL = os.getenv("LLM_MODEL", "llama3")
 
 mcp = FastMCP("maintenance-services")
 
 
 @mcp.tool()
-def get_payment_status(flat_no: str, month_year: str):
+def get_payment_status(flat_no: str, month_year: str, society_id: str | None = None):
     """Fetch payment status for a flat/month."""
-    resp = requests.get(
-        f"{PAYMENTS_URL}/get_payment_status",
-        params={"flat_no": flat_no, "month_year": month_year},
-        timeout=10,
-    )
-    if resp.status_code == 404:
+    with span("tool.get_payment_status", service="mcp"), deadline():
+        payment = client.get_payment_status(flat_no, month_year, society_id)
+    if payment is None:
         return {"error": "not_found", "flat_no": flat_no, "month_year": month_year}
-    resp.raise_for_status()
-    return resp.json()
+    return payment
 
 
 @mcp.tool()
-def add_flat(flat_no: str, owner_name: str | None = None, phone_number: str | None = None, whatsapp_number: str | None = None):
+def add_flat(
+    flat_no: str,
+    owner_name: str | None = None,
+    phone_number: str | None = None,
+    whatsapp_number: str | None = None,
+    society_id: str | None = None,
+):
     """Add or update a flat record."""
-    resp = requests.post(
-        f"{PAYMENTS_URL}/add_flat",
-        json={
-            "flat_no": flat_no,
-            "owner_name": owner_name,
-            "phone_number": phone_number,
-            "whatsapp_number": whatsapp_number,
-        },
-        timeout=10,
-    )
-    resp.raise_for_status()
-    return resp.json()
+    with span("tool.add_flat", service="mcp"), deadline():
+        return client.add_flat(flat_no, owner_name, phone_number, whatsapp_number, society_id)
 
 
 @mcp.tool()
-def list_flats():
+def list_flats(society_id: str | None = None):
     """List known flats."""
-    resp = requests.get(f"{PAYMENTS_URL}/list_flats", timeout=10)
-    resp.raise_for_status()
-    return resp.json()
+    with span("tool.list_flats", service="mcp"), deadline():
+        return client.list_flats(society_id)
+
+
+@mcp.tool()
+def search_flats(query: str, limit: int = 10, society_id: str | None = None):
+    """Find flats by flat number or owner name prefix, with fuzzy fallback (e.g. "Rajesh", "the Das family")."""
+    with span("tool.search_flats", service="mcp"), deadline():
+        return client.search_flats(query, limit, society_id)
+
+
+@mcp.tool()
+def payment_summary(month_year: str, society_ids: list[str] | None = None):
+    """Paid/unpaid counts per society for a month, across all societies unless filtered."""
+    with span("tool.payment_summary", service="mcp"), deadline():
+        return client.payment_summary(month_year, society_ids)
+
+
+@mcp.tool()
+def audit_summary(month_year: str, society_ids: list[str] | None = None):
+    """Audit event counts per society and event type for a month."""
+    with span("tool.audit_summary", service="mcp"), deadline():
+        return client.event_summary(month_year, society_ids)
 
 
 @mcp.tool()
 def send_whatsapp_reminder(flat_no: str, month_year: str):
     """Send a WhatsApp reminder (stub)."""
-    resp = requests.post(
-        f"{WHATSAPP_URL}/send_reminder",
-        json={"flat_no": flat_no, "month_year": month_year},
-        timeout=10,
-    )
-    resp.raise_for_status()
-    data = resp.json()
+    with span("tool.send_whatsapp_reminder", service="mcp"), deadline():
+        data = client.send_reminder(flat_no, month_year)
     data["sent_at"] = datetime.utcnow().isoformat()
     return data
 
 
 @mcp.tool()
-def log_event(event_type: str, flat_no: str, month_year: str, details: dict | None = None):
+def log_event(
+    event_type: str,
+    flat_no: str,
+    month_year: str,
+    details: dict | None = None,
+    society_id: str | None = None,
+):
     """Log an audit event."""
-    resp = requests.post(
-        f"{AUDIT_URL}/log_event",
-        json={
-            "event_type": event_type,
-            "flat_no": flat_no,
-            "month_year": month_year,
-            "details": details or {},
-        },
-        timeout=10,
-    )
-    resp.raise_for_status()
-    return resp.json()
+    with span("tool.log_event", service="mcp"), deadline():
+        return client.log_event(event_type, flat_no, month_year, details or {}, society_id)
 
 
 @mcp.tool()
-def check_and_remind(flat_no: str, month_year: str):
+def check_and_remind(flat_no: str, month_year: str, society_id: str | None = None):
     """
     Check payment status and, if unpaid, send a reminder and log it.
     Returns a summary with payment, reminder, and audit results.
     """
     result: dict = {"flat_no": flat_no, "month_year": month_year}
-
-    # Check payment status
-    pay_resp = requests.get(
-        f"{PAYMENTS_URL}/get_payment_status",
-        params={"flat_no": flat_no, "month_year": month_year},
-        timeout=10,
-    )
-    if pay_resp.status_code == 404:
-        result["payment"] = {"error": "not_found"}
-        return result
-    pay_resp.raise_for_status()
-    payment = pay_resp.json()
-    result["payment"] = payment
-
-    # If already paid, no reminder
-    if payment.get("is_paid"):
-        return result
-
-    # Send reminder
-    rem_resp = requests.post(
-        f"{WHATSAPP_URL}/send_reminder",
-        json={"flat_no": flat_no, "month_year": month_year},
-        timeout=10,
-    )
-    rem_resp.raise_for_status()
-    reminder = rem_resp.json()
-    reminder["sent_at"] = datetime.utcnow().isoformat()
-    result["reminder"] = reminder
-
-    # Log audit
-    audit_resp = requests.post(
-        f"{AUDIT_URL}/log_event",
-        json={
-            "event_type": "MAINTENANCE_REMINDER_SENT",
-            "flat_no": flat_no,
-            "month_year": month_year,
-            "details": {"reminder": reminder},
-        },
-        timeout=10,
-    )
-    audit_resp.raise_for_status()
-    result["audit_log"] = audit_resp.json()
+    if society_id is not None:
+        result["society_id"] = society_id
+
+    # one budget for the whole tool; unused time from a step rolls over to the next
+    with span("tool.check_and_remind", service="mcp") as root, deadline():
+        result["request_id"] = root["trace_id"]
+
+        # Check payment status
+        with step(0.4):
+            payment = client.get_payment_status(flat_no, month_year, society_id)
+        if payment is None:
+            result["payment"] = {"error": "not_found"}
+            return result
+        result["payment"] = payment
+
+        # If already paid, no reminder
+        if payment.get("is_paid"):
+            return result
+
+        # Send reminder
+        with step(0.5):
+            reminder = client.send_reminder(flat_no, month_year)
+        reminder["sent_at"] = datetime.utcnow().isoformat()
+        result["reminder"] = reminder
+
+        # Log audit
+        result["audit_log"] = client.log_event(
+            "MAINTENANCE_REMINDER_SENT",
+            flat_no,
+            month_year,
+            {"reminder": reminder},
+            society_id,
+        )
 
     return result
 
@@ -138,19 +131,22 @@ def check_and_remind(flat_no: str, month_year: str):
 @mcp.tool()
 def llm_chat(user_message: str):
     """Pass through to the mock LLM for explanations/plans."""
-    resp = requests.post(
-        f"{LLM_URL}/api/chat",
-        json={
-            "model": LLM_MODEL,
-            "messages": [
+    # LLM calls are bounded by LLM_TIMEOUT_SECONDS, not the request deadline
+    with span("tool.llm_chat", service="mcp"):
+        return client.chat(
+            LLM_MODEL,
+            [
                 {"role": "system", "content": "You are a helpful maintenance assistant."},
                 {"role": "user", "content": user_message},
             ],
-        },
-        timeout=30,
-    )
-    resp.raise_for_status()
-    return resp.json()
+            timeout=LLM_TIMEOUT_SECONDS,
+        )
+
+
+@mcp.tool()
+def health():
+    """Report circuit-breaker state for each downstream service."""
+    return {"status": "ok", "breakers": client.breaker_states()}
 
 
 if __name__ == "__main__":
@@ -0,0 +1,29 @@
+"""
+All service APIs in one ASGI process, for small single-VM installs.
+
+    uvicorn services.all_in_one:app --host 0.0.0.0 --port 8000
+
+Each service keeps its own routes under a prefix, so HTTP clients only need the
+URLs pointed at it (e.g. PAYMENTS_URL=http://host:8000/payments). Clients
+running in the same process should set DEPLOY_MODE=all-in-one instead, which
+makes services.client call the endpoint functions directly.
+"""
+from fastapi import FastAPI
+
+from services import audit_service, client, llm_mock, payments_service, whatsapp_service
+
+app = FastAPI(title="Maintenance Services (all-in-one)")
+
+app.mount("/payments", payments_service.app)
+app.mount("/whatsapp", whatsapp_service.app)
+app.mount("/audit", audit_service.app)
+app.mount("/llm", llm_mock.app)
+
+
+@app.get("/health")
+def health():
+    return {
+        "status": "ok",
+        "services": ["payments", "whatsapp", "audit", "llm"],
+        "breakers": client.published_breaker_states(),
+    }
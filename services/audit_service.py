@@ -1,20 +1,17 @@
-from fastapi import FastAPI, HTTPException
+from typing import Annotated
+
+from fastapi import FastAPI, HTTPException, Query
 from pydantic import BaseModel
-import psycopg2
-import os
 import json
 
-app = FastAPI(title="Audit Log Service")
-
+from services import shards
+from services.shards import DEFAULT_SOCIETY
+from services.client import published_breaker_states
+from services.tracing import instrument, span
 
-def get_conn():
-    return psycopg2.connect(
-        dbname=os.getenv("POSTGRES_DB", "maintdb"),
-        user=os.getenv("POSTGRES_USER", "maintuser"),
-        password=os.getenv("POSTGRES_PASSWORD", "maintpass"),
-        host=os.getenv("POSTGRES_HOST", "db"),
-        port=5432,
-    )
+app = FastAPI(title="Audit Log Service")
+instrument(app, "audit-service")
+app.add_exception_handler(shards.ShardUnavailable, shards.shard_unavailable_response)
 
 
 class AuditEvent(BaseModel):
@@ -22,35 +19,70 @@ class AuditEvent(BaseModel):
     flat_no: str
     month_year: str
     details: dict
+    society_id: str = DEFAULT_SOCIETY
 
 
 @app.get("/health")
 def health():
-    return {"status": "ok"}
+    return {"status": "ok", "shards": sorted(shards.SHARDS), "breakers": published_breaker_states()}
 
 
 @app.post("/log_event")
 def log_event(ev: AuditEvent):
-    conn = get_conn()
-    try:
+    with shards.connection(ev.society_id) as conn:
         cur = conn.cursor()
         # resolve flat_id
-        cur.execute("SELECT flat_id FROM flats WHERE flat_no = %s", (ev.flat_no,))
-        row = cur.fetchone()
+        with span("db.resolve_flat"):
+            cur.execute(
+                "SELECT flat_id FROM flats WHERE society_id = %s AND flat_no = %s",
+                (ev.society_id, ev.flat_no),
+            )
+            row = cur.fetchone()
         if not row:
             raise HTTPException(status_code=404, detail="Flat not found")
         flat_id = row[0]
 
-        cur.execute(
-            """
-            INSERT INTO audit_logs (event_type, flat_id, month_year, details_json)
-            VALUES (%s, %s, %s, %s)
-            RETURNING log_id
-            """,
-            (ev.event_type, flat_id, ev.month_year, json.dumps(ev.details)),
-        )
-        log_id = cur.fetchone()[0]
-        conn.commit()
-        return {"status": "OK", "log_id": log_id}
-    finally:
-        conn.close()
+        with span("db.insert_audit_log"):
+            cur.execute(
+                """
+                INSERT INTO audit_logs (society_id, event_type, flat_id, month_year, details_json)
+                VALUES (%s, %s, %s, %s, %s)
+                RETURNING log_id
+                """,
+                (ev.society_id, ev.event_type, flat_id, ev.month_year, json.dumps(ev.details)),
+            )
+            log_id = cur.fetchone()[0]
+            conn.commit()
+        return {"status": "OK", "log_id": log_id, "society_id": ev.society_id}
+
+
+def _shard_event_counts(shard: str, month_year: str, society_ids: list[str] | None) -> list[tuple]:
+    with shards.connection(shard=shard) as conn:
+        cur = conn.cursor()
+        with span("db.event_counts", shard=shard):
+            cur.execute(
+                """
+                SELECT society_id, event_type, COUNT(*)
+                FROM audit_logs
+                WHERE month_year = %s AND (%s::text[] IS NULL OR society_id = ANY(%s::text[]))
+                GROUP BY society_id, event_type
+                """,
+                (month_year, society_ids, society_ids),
+            )
+            return cur.fetchall()
+
+
+@app.get("/event_summary")
+def event_summary(month_year: str, society_id: Annotated[list[str] | None, Query()] = None):
+    """Audit event counts per society and type, fanned out over the shards in parallel."""
+    results, errors = shards.fan_out(
+        lambda shard: _shard_event_counts(shard, month_year, society_id),
+        shards.shards_for(society_id),
+    )
+    societies: dict[str, dict[str, int]] = {}
+    for shard, rows in results.items():
+        for society, event_type, count in rows:
+            if shards.shard_for(society) != shard:
+                continue
+            societies.setdefault(society, {})[event_type] = count
+    return {"month_year": month_year, "societies": societies, "shard_errors": errors}
@@ -0,0 +1,331 @@
+"""
+Plan (and optionally execute) a JSONL file of natural-language requests.
+
+    python -m services.batch_planner requests.jsonl plans.jsonl [--workers 4] [--execute]
+
+Each input line is a JSON object, or a bare JSON string. For objects the text
+comes from --text-field, or else the first of text/message/body/prompt/title.
+Each output line is {"line", "id", "request", "plan"}, plus "result" with
+--execute, or it carries an "error" instead. An input "society_id" is carried
+through and used when executing.
+
+Input is read lazily and sent in chunks to a process pool, with a bounded
+number of chunks in flight. Each worker runs the mock planner in-process by
+default. With --remote it posts its chunk to LLM_URL's /api/chat/batch instead.
+Output is appended and flushed chunk by chunk, in input order. Running again
+with the same output file skips lines that were already planned, so an
+interrupted run picks up where it stopped. Lines that could not be planned
+(the planner was down, say) are removed and planned again.
+
+A line whose execution failed keeps its "error" together with whatever did
+run ("payment", "reminder") and counts as done. With --retry-execution those
+lines are executed again with the plan they already have; a reminder the
+record shows as sent is not sent again, only its audit log is completed.
+Reminders from a chunk that was still in flight when the run was interrupted
+are not recorded and may be sent twice.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from services import client
+from services.planner import PLANNER_SYSTEM, parse_plan
+from services.resilience import deadline
+from services.tracing import span
+
+LLM_MODEL = os.getenv("LLM_MODEL", "llama3")
+
+_TEXT_FIELDS = ("text", "message", "body", "prompt", "title")
+_ID_FIELDS = ("id", "request_id")
+
+
+def _request_text(obj, text_field: str | None) -> str | None:
+    if isinstance(obj, str):
+        return obj
+    if not isinstance(obj, dict):
+        return None
+    for field in (text_field,) if text_field else _TEXT_FIELDS:
+        if isinstance(obj.get(field), str) and obj[field].strip():
+            return obj[field]
+    return None
+
+
+def _done_line(raw: bytes) -> tuple[int | None, dict | None]:
+    """
+    (input line number, record) of a finished output line, or (None, None) if it
+    should be planned again. Execution failures count as finished.
+    """
+    if not raw.endswith(b"\n"):
+        return None, None  # half-written by an interrupted run
+    try:
+        record = json.loads(raw)
+        if "error" in record and "plan" not in record:
+            return None, None
+        return int(record["line"]), record
+    except (ValueError, KeyError, TypeError):
+        return None, None
+
+
+def _failed_execution(record: dict | None) -> bool:
+    return record is not None and "plan" in record and "error" in record
+
+
+def _done_lines(path: str, retry_execution: bool = False) -> tuple[set[int], dict[int, dict]]:
+    """
+    Line numbers already handled in `path`, and the records of failed executions
+    to run again (only with `retry_execution`). Lines that were never planned,
+    were cut short, or are being retried are removed from the file so that this
+    run redoes them. Both passes stream the file; it is only rewritten when
+    something is removed.
+    """
+    if not os.path.exists(path):
+        return set(), {}
+    done = set()
+    retry = {}
+    redo = 0
+    with open(path, "rb") as fh:
+        for raw in fh:
+            line, record = _done_line(raw)
+            if line is None:
+                redo += 1
+            elif retry_execution and _failed_execution(record):
+                retry[line] = {"plan": record["plan"], "result": record.get("result") or {}}
+            else:
+                done.add(line)
+    if redo or retry:
+        tmp = f"{path}.tmp"
+        with open(path, "rb") as src, open(tmp, "wb") as dst:
+            for raw in src:
+                line, record = _done_line(raw)
+                if line is not None and not (retry_execution and _failed_execution(record)):
+                    dst.write(raw)
+        os.replace(tmp, path)
+    return done, retry
+
+
+def _iter_chunks(
+    path: str,
+    done: set[int],
+    chunk_size: int,
+    text_field: str | None,
+    id_field: str | None,
+    retry: dict[int, dict] | None = None,
+):
+    retry = retry or {}
+    chunk = []
+    with open(path, encoding="utf-8") as fh:
+        for line_no, raw in enumerate(fh, start=1):
+            if line_no in done or not raw.strip():
+                continue
+            item = {"line": line_no, "id": None, "request": None}
+            try:
+                obj = json.loads(raw)
+            except ValueError:
+                item["error"] = "invalid JSON"
+            else:
+                if isinstance(obj, dict):
+                    for field in (id_field,) if id_field else _ID_FIELDS:
+                        if obj.get(field) is not None:
+                            item["id"] = str(obj[field])
+                            break
+                    if obj.get("society_id"):
+                        item["society_id"] = str(obj["society_id"])
+                item["request"] = _request_text(obj, text_field)
+                if item["request"] is None:
+                    item["error"] = "no request text"
+                elif line_no in retry:
+                    # executed before: keep its plan and what already ran
+                    item["plan"] = retry[line_no]["plan"]
+                    item["previous"] = retry[line_no]["result"]
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def _plan_chunk(items: list[dict], remote: bool, model: str) -> list[dict]:
+    """Worker: plan every item of one chunk with a single batch call."""
+    todo = [item for item in items if "error" not in item and "plan" not in item]
+    if not todo:
+        return items
+    batch = [
+        {
+            "id": str(item["line"]),
+            "messages": [
+                {"role": "system", "content": PLANNER_SYSTEM},
+                {"role": "user", "content": item["request"]},
+            ],
+        }
+        for item in todo
+    ]
+    try:
+        if remote:
+            results = client.chat_batch(model, batch)["results"]
+        else:
+            from services import llm_mock
+
+            results = llm_mock.chat_batch(llm_mock.BatchChatRequest(model=model, requests=batch))["results"]
+    except Exception as ex:
+        for item in todo:
+            item["error"] = f"planner failed: {ex}"
+        return items
+
+    for item, res in zip(todo, results):
+        plan = parse_plan(res["message"]["content"])
+        if "error" in plan:
+            item["error"] = plan["error"]
+        else:
+            item["plan"] = plan
+    return items
+
+
+def execute_plan(plan: dict, society_id: str | None = None, result: dict | None = None) -> dict:
+    """
+    Run the tools for one plan the same way the UI does.
+
+    `result` is filled in as each step completes, so a caller that passes one in
+    still has the partial result when a later step raises. Steps it already
+    holds from an earlier attempt are not run again; in particular a reminder
+    that was sent is only logged, never re-sent.
+    """
+    flat_no = plan.get("flat_no")
+    month_year = plan.get("month_year")
+    action = plan.get("action", "CHECK_ONLY")
+    result = {} if result is None else result
+
+    with span("batch.execute", service="batch-planner"), deadline():
+        if action == "ADD_FLAT":
+            result["flat"] = client.add_flat(
+                flat_no,
+                plan.get("owner_name"),
+                plan.get("phone_number"),
+                plan.get("whatsapp_number"),
+                society_id,
+            )
+            return result
+
+        if "reminder" not in result:
+            payment = client.get_payment_status(flat_no, month_year, society_id)
+            result["payment"] = payment or {"error": "not_found"}
+            if action == "CHECK_AND_REMIND" and payment and payment.get("is_paid") is False:
+                result["reminder"] = client.send_reminder(flat_no, month_year)
+        if "reminder" in result and "audit_log" not in result:
+            result["audit_log"] = client.log_event(
+                "MAINTENANCE_REMINDER_SENT",
+                flat_no,
+                month_year,
+                {"reminder": result["reminder"]},
+                society_id,
+            )
+    return result
+
+
+def _execute_safely(item: dict) -> dict:
+    result = dict(item.pop("previous", None) or {})
+    try:
+        return {"result": execute_plan(item["plan"], item.get("society_id"), result)}
+    except Exception as ex:
+        # what did run is kept, so a retry never repeats a sent reminder
+        return {"result": result, "error": f"execution failed: {ex}"}
+
+
+class _Progress:
+    def __init__(self, resumed: int, every: float = 2.0):
+        self.resumed = resumed
+        self.written = 0
+        self.errors = 0
+        self.every = every
+        self.started = time.monotonic()
+        self._last = self.started
+
+    def add(self, items: list[dict]) -> None:
+        self.written += len(items)
+        self.errors += sum(1 for item in items if "error" in item)
+        if time.monotonic() - self._last >= self.every:
+            self.report()
+
+    def report(self, final: bool = False) -> None:
+        self._last = time.monotonic()
+        elapsed = self._last - self.started
+        rate = self.written / elapsed if elapsed > 0 else 0.0
+        print(
+            f"{'done' if final else 'progress'}: {self.written} lines written "
+            f"({self.errors} errors, {self.resumed} skipped from earlier runs) "
+            f"in {elapsed:.1f}s, {rate:.0f} lines/s",
+            file=sys.stderr,
+            flush=True,
+        )
+
+
+def run(args) -> int:
+    done, retry = _done_lines(args.output, retry_execution=args.execute and args.retry_execution)
+    progress = _Progress(resumed=len(done))
+    pool = ProcessPoolExecutor(max_workers=args.workers)
+    exec_pool = ThreadPoolExecutor(max_workers=args.exec_concurrency) if args.execute else None
+    in_flight: deque = deque()
+
+    def drain_one(out_fh) -> None:
+        items = in_flight.popleft().result()
+        if exec_pool is not None:
+            planned = [item for item in items if "plan" in item]
+            for item, outcome in zip(planned, exec_pool.map(_execute_safely, planned)):
+                item.update(outcome)
+        for item in items:
+            out_fh.write(json.dumps(item, default=str) + "\n")
+        out_fh.flush()
+        progress.add(items)
+
+    try:
+        with open(args.output, "a", encoding="utf-8") as out_fh:
+            for chunk in _iter_chunks(
+                args.input, done, args.chunk_size, args.text_field, args.id_field, retry
+            ):
+                in_flight.append(pool.submit(_plan_chunk, chunk, args.remote, args.model))
+                if len(in_flight) >= args.workers * 2:
+                    drain_one(out_fh)
+            while in_flight:
+                drain_one(out_fh)
+    except KeyboardInterrupt:
+        pool.shutdown(wait=False, cancel_futures=True)
+        if exec_pool is not None:
+            exec_pool.shutdown(wait=False, cancel_futures=True)
+        progress.report()
+        print("interrupted; rerun with the same output file to resume", file=sys.stderr)
+        return 130
+    pool.shutdown()
+    if exec_pool is not None:
+        exec_pool.shutdown()
+    progress.report(final=True)
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Plan a JSONL file of maintenance requests.")
+    parser.add_argument("input", help="JSONL file of requests")
+    parser.add_argument(
+        "output", help="JSONL file for plans; appended to and used to resume (unplanned lines are retried)"
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="planner processes")
+    parser.add_argument("--chunk-size", type=int, default=64, help="requests per planner call")
+    parser.add_argument("--remote", action="store_true", help="plan via LLM_URL /api/chat/batch instead of in-process")
+    parser.add_argument("--model", default=LLM_MODEL)
+    parser.add_argument("--text-field", help="field holding the request text")
+    parser.add_argument("--id-field", help="field holding the request id")
+    parser.add_argument("--execute", action="store_true", help="also run each plan against the services")
+    parser.add_argument("--exec-concurrency", type=int, default=4, help="plans executed at once with --execute")
+    parser.add_argument(
+        "--retry-execution",
+        action="store_true",
+        help="with --execute, run failed executions from the output file again (sent reminders are not re-sent)",
+    )
+    return run(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,437 @@
+"""
+Tool-facing client for the maintenance services.
+
+The MCP server and the Streamlit app call these functions instead of building
+HTTP requests themselves. With `DEPLOY_MODE=split` (default) each call goes over
+HTTP to the service URLs; with `DEPLOY_MODE=all-in-one` the call is dispatched to
+the FastAPI endpoint function in this process, skipping the HTTP/JSON round trip.
+
+Every call is capped by the current request deadline and guarded by a
+per-service circuit breaker (see services.resilience).
+"""
+import json
+import os
+import threading
+import time
+
+import requests
+
+from services.resilience import HEDGE_AFTER_MS, CircuitBreaker, deadline, hedged, remaining
+from services.tracing import outgoing_headers, span
+
+DEPLOY_MODE = os.getenv("DEPLOY_MODE", "split")
+IN_PROCESS = DEPLOY_MODE == "all-in-one"
+
+PAYMENTS_URL = os.getenv("PAYMENTS_URL", "http://payments-service:8001")
+WHATSAPP_URL = os.getenv("WHATSAPP_URL", "http://whatsapp-service:8002")
+AUDIT_URL = os.getenv("AUDIT_URL", "http://audit-service:8003")
+LLM_URL = os.getenv("LLM_URL", "http://llm:11434")
+
+SERVICE_URLS = {
+    "payments-service": PAYMENTS_URL,
+    "whatsapp-service": WHATSAPP_URL,
+    "audit-service": AUDIT_URL,
+    "llm": LLM_URL,
+}
+
+
+class ServiceError(Exception):
+    """A downstream service answered with an error status."""
+
+    def __init__(self, service: str, status_code: int, detail, shard: str | None = None):
+        super().__init__(f"{service} returned {status_code}: {detail}")
+        self.service = service
+        self.status_code = status_code
+        self.detail = detail
+        # set when the service is fine but one database shard is unreachable
+        self.shard = shard
+
+
+class CircuitOpenError(ServiceError):
+    """The service's (or shard's) breaker is open; the call was not attempted."""
+
+    def __init__(self, service: str, shard: str | None = None):
+        scope = f" for shard {shard!r}" if shard else ""
+        super().__init__(service, 503, f"circuit open{scope}, failing fast", shard)
+
+
+class DeadlineExceeded(ServiceError):
+    """The request ran out of time before or during this call."""
+
+    def __init__(self, service: str, detail: str = "request deadline exceeded"):
+        super().__init__(service, 504, detail)
+
+
+# Breakers live in the calling process (UI, MCP server, batch planner), not in
+# the services. With BREAKER_STATE_DIR set, each caller writes its snapshot to
+# <dir>/<SERVICE_NAME>.json on every change, and the services' /health reads them.
+BREAKER_STATE_DIR = os.getenv("BREAKER_STATE_DIR")
+CALLER_NAME = os.getenv("SERVICE_NAME") or f"pid-{os.getpid()}"
+
+
+def breaker_states() -> dict:
+    """Snapshot of every downstream breaker of this process."""
+    states = {name: breaker.snapshot() for name, breaker in _breakers.items()}
+    for (service, shard), breaker in list(_shard_breakers.items()):
+        states[f"{service}/{shard}"] = breaker.snapshot()
+    return states
+
+
+def _publish_breakers() -> None:
+    if not BREAKER_STATE_DIR:
+        return
+    path = os.path.join(BREAKER_STATE_DIR, f"{CALLER_NAME}.json")
+    record = {"updated_at": time.time(), "breakers": breaker_states()}
+    try:
+        os.makedirs(BREAKER_STATE_DIR, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(record, fh)
+        os.replace(tmp, path)
+    except OSError:
+        # reporting must never break the call it reports on
+        pass
+
+
+def published_breaker_states() -> dict:
+    """{caller: {"updated_at", "breakers"}} for every caller sharing BREAKER_STATE_DIR."""
+    if not BREAKER_STATE_DIR or not os.path.isdir(BREAKER_STATE_DIR):
+        return {}
+    states = {}
+    for entry in sorted(os.listdir(BREAKER_STATE_DIR)):
+        if not entry.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(BREAKER_STATE_DIR, entry), encoding="utf-8") as fh:
+                states[entry[: -len(".json")]] = json.load(fh)
+        except (OSError, ValueError):
+            continue
+    return states
+
+
+_breakers = {name: CircuitBreaker(name, on_change=_publish_breakers) for name in SERVICE_URLS}
+
+# An unreachable shard only fails the societies on it: services answer 503 with
+# the shard's name, which counts against a (service, shard) breaker instead of
+# the service's own. The client has no shard map, so it learns society -> shard
+# from those answers (routing is fixed for the life of the services).
+_shard_breakers: dict[tuple[str, str], CircuitBreaker] = {}
+_society_shards: dict[str, str] = {}
+_shard_lock = threading.Lock()
+
+
+def _shard_breaker(service: str, shard: str) -> CircuitBreaker:
+    with _shard_lock:
+        breaker = _shard_breakers.get((service, shard))
+        if breaker is None:
+            breaker = _shard_breakers[(service, shard)] = CircuitBreaker(
+                f"{service}/{shard}", on_change=_publish_breakers
+            )
+        return breaker
+
+
+def _society_of(params: dict | None, body: dict | None) -> str:
+    # "" stands for the service's default society; lists are fan-out queries
+    society = (params or {}).get("society_id") or (body or {}).get("society_id") or ""
+    return society if isinstance(society, str) else ""
+
+
+_local_routes: dict | None = None
+
+
+def _routes() -> dict:
+    # imported lazily so split-mode clients don't need psycopg2 or the service code
+    global _local_routes
+    if _local_routes is None:
+        from services import audit_service, llm_mock, payments_service, whatsapp_service
+
+        _local_routes = {
+            ("payments-service", "/get_payment_status"): lambda params, body: payments_service.get_payment_status(**params),
+            ("payments-service", "/add_flat"): lambda params, body: payments_service.add_flat(payments_service.FlatCreate(**body)),
+            ("payments-service", "/list_flats"): lambda params, body: payments_service.list_flats(**params),
+            ("payments-service", "/search_flats"): lambda params, body: payments_service.search_flats(**params),
+            ("payments-service", "/payment_summary"): lambda params, body: payments_service.payment_summary(**params),
+            ("whatsapp-service", "/send_reminder"): lambda params, body: whatsapp_service.send_reminder(whatsapp_service.ReminderRequest(**body)),
+            ("audit-service", "/log_event"): lambda params, body: audit_service.log_event(audit_service.AuditEvent(**body)),
+            ("audit-service", "/event_summary"): lambda params, body: audit_service.event_summary(**params),
+            ("llm", "/api/chat"): lambda params, body: llm_mock.chat(llm_mock.ChatRequest(**body)),
+            ("llm", "/api/chat/batch"): lambda params, body: llm_mock.chat_batch(llm_mock.BatchChatRequest(**body)),
+        }
+    return _local_routes
+
+
+def _call_local(service: str, method: str, path: str, params: dict | None, body: dict | None):
+    # same error contract as _call_http: bad input is a 422, anything the
+    # endpoint did not handle is a 500, as FastAPI would have answered, and
+    # running out of time (no free connection, statement timeout) is a 504
+    from fastapi import HTTPException
+    from psycopg2.errors import QueryCanceled
+    from pydantic import ValidationError
+
+    from services.shards import ShardUnavailable
+
+    handler = _routes()[(service, path)]
+    with span(f"{method} {path}", service=service):
+        try:
+            return handler(params or {}, body or {})
+        except HTTPException as ex:
+            raise ServiceError(service, ex.status_code, ex.detail) from ex
+        except ValidationError as ex:
+            raise ServiceError(service, 422, ex.errors(include_url=False)) from ex
+        except ShardUnavailable as ex:
+            raise ServiceError(service, 503, str(ex), shard=ex.shard) from ex
+        except (TimeoutError, QueryCanceled) as ex:
+            raise DeadlineExceeded(service, str(ex).strip()) from ex
+        except ServiceError:
+            raise
+        except Exception as ex:
+            raise ServiceError(service, 500, f"{type(ex).__name__}: {ex}") from ex
+
+
+def _call_http(service: str, method: str, path: str, params: dict | None, body: dict | None, timeout: float):
+    try:
+        resp = requests.request(
+            method,
+            f"{SERVICE_URLS[service]}{path}",
+            params=params,
+            json=body,
+            headers=outgoing_headers(),
+            timeout=timeout,
+        )
+    except requests.Timeout as ex:
+        raise DeadlineExceeded(service, f"no answer within {timeout:.1f}s") from ex
+    except requests.RequestException as ex:
+        raise ServiceError(service, 503, str(ex)) from ex
+    if resp.status_code >= 400:
+        shard = None
+        try:
+            payload = resp.json()
+            detail = payload.get("detail", resp.text)
+            shard = payload.get("shard")
+        except (ValueError, AttributeError):
+            detail = resp.text
+        raise ServiceError(service, resp.status_code, detail, shard=shard)
+    return resp.json()
+
+
+def _fail_fast(error: ServiceError):
+    # a call refused before dispatch still leaves a (near zero-length) span with
+    # the error, so fast fails show up in traces and the critical-path viewer
+    with span(f"call {error.service}", fast_fail=True):
+        raise error
+
+
+def call(
+    service: str,
+    method: str,
+    path: str,
+    params: dict | None = None,
+    body: dict | None = None,
+    timeout: float = 10,
+    hedge: bool = False,
+):
+    """
+    Invoke one service endpoint, in-process or over HTTP depending on DEPLOY_MODE.
+
+    `timeout` is an upper bound; the remaining request deadline wins when it is
+    shorter. `hedge=True` marks the call as an idempotent read that may be sent
+    twice when HEDGE_AFTER_MS is set.
+    """
+    left = remaining()
+    # when the request budget, not this call's own limit, sets the timeout, running
+    # out of time is the caller's problem and must not count against the service
+    capped = False
+    if left is not None:
+        if left <= 0:
+            _fail_fast(DeadlineExceeded(service))
+        capped = left < timeout
+        timeout = min(timeout, left)
+
+    breaker = _breakers[service]
+    society = _society_of(params, body)
+    shard = _society_shards.get(society)
+    shard_breaker = _shard_breaker(service, shard) if shard else None
+    if shard_breaker is not None and not shard_breaker.allow():
+        _fail_fast(CircuitOpenError(service, shard))
+    if not breaker.allow():
+        if shard_breaker is not None:
+            shard_breaker.record_abandoned()
+        _fail_fast(CircuitOpenError(service))
+
+    with span(f"call {service}", timeout_s=round(timeout, 3)):
+        try:
+            if IN_PROCESS:
+                # the endpoint's DB work is bounded by this deadline (see services.shards)
+                with deadline(timeout):
+                    result = _call_local(service, method, path, params, body)
+            elif hedge and HEDGE_AFTER_MS > 0:
+                ends = time.monotonic() + timeout
+
+                def attempt():
+                    # the hedge copy starts later and only gets the time left by then
+                    left = ends - time.monotonic()
+                    if left <= 0:
+                        raise DeadlineExceeded(service)
+                    return _call_http(service, method, path, params, body, left)
+
+                result = hedged(attempt, HEDGE_AFTER_MS / 1000)
+            else:
+                result = _call_http(service, method, path, params, body, timeout)
+        except DeadlineExceeded:
+            if capped:
+                breaker.record_abandoned()
+            else:
+                breaker.record_failure()
+            if shard_breaker is not None:
+                shard_breaker.record_abandoned()
+            raise
+        except ServiceError as ex:
+            if ex.shard:
+                # the service answered; only the society's shard is down
+                breaker.record_success()
+                _society_shards[society] = ex.shard
+                if shard_breaker is not None and shard_breaker.name != f"{service}/{ex.shard}":
+                    shard_breaker.record_abandoned()
+                _shard_breaker(service, ex.shard).record_failure()
+                raise
+            # 4xx means the service is up and answered; only 5xx counts against it
+            if ex.status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            if shard_breaker is not None:
+                shard_breaker.record_abandoned()
+            raise
+        except Exception:
+            breaker.record_failure()
+            if shard_breaker is not None:
+                shard_breaker.record_abandoned()
+            raise
+    breaker.record_success()
+    if shard_breaker is not None:
+        shard_breaker.record_success()
+    return result
+
+
+def _scoped(fields: dict, society_id: str | None) -> dict:
+    # leave society_id out when unset so the service applies its own default
+    if society_id is not None:
+        fields["society_id"] = society_id
+    return fields
+
+
+def get_payment_status(flat_no: str, month_year: str, society_id: str | None = None, timeout: float = 10) -> dict | None:
+    """Payment status for a flat/month, or None when there is no record."""
+    try:
+        return call(
+            "payments-service",
+            "GET",
+            "/get_payment_status",
+            params=_scoped({"flat_no": flat_no, "month_year": month_year}, society_id),
+            timeout=timeout,
+            hedge=True,
+        )
+    except ServiceError as ex:
+        if ex.status_code == 404:
+            return None
+        raise
+
+
+def add_flat(
+    flat_no: str,
+    owner_name: str | None = None,
+    phone_number: str | None = None,
+    whatsapp_number: str | None = None,
+    society_id: str | None = None,
+    timeout: float = 10,
+) -> dict:
+    return call(
+        "payments-service",
+        "POST",
+        "/add_flat",
+        body=_scoped(
+            {
+                "flat_no": flat_no,
+                "owner_name": owner_name,
+                "phone_number": phone_number,
+                "whatsapp_number": whatsapp_number,
+            },
+            society_id,
+        ),
+        timeout=timeout,
+    )
+
+
+def list_flats(society_id: str | None = None, timeout: float = 10) -> list[dict]:
+    return call("payments-service", "GET", "/list_flats", params=_scoped({}, society_id), timeout=timeout, hedge=True)
+
+
+def search_flats(q: str, limit: int = 10, society_id: str | None = None, timeout: float = 10) -> dict:
+    return call(
+        "payments-service",
+        "GET",
+        "/search_flats",
+        params=_scoped({"q": q, "limit": limit}, society_id),
+        timeout=timeout,
+        hedge=True,
+    )
+
+
+def payment_summary(month_year: str, society_ids: list[str] | None = None, timeout: float = 30) -> dict:
+    """Paid/unpaid counts per society; the service fans out across shards."""
+    params: dict = {"month_year": month_year}
+    if society_ids:
+        params["society_id"] = society_ids
+    return call("payments-service", "GET", "/payment_summary", params=params, timeout=timeout, hedge=True)
+
+
+def event_summary(month_year: str, society_ids: list[str] | None = None, timeout: float = 30) -> dict:
+    """Audit event counts per society and type; the service fans out across shards."""
+    params: dict = {"month_year": month_year}
+    if society_ids:
+        params["society_id"] = society_ids
+    return call("audit-service", "GET", "/event_summary", params=params, timeout=timeout, hedge=True)
+
+
+def send_reminder(flat_no: str, month_year: str, timeout: float = 10) -> dict:
+    return call(
+        "whatsapp-service",
+        "POST",
+        "/send_reminder",
+        body={"flat_no": flat_no, "month_year": month_year},
+        timeout=timeout,
+    )
+
+
+def log_event(
+    event_type: str,
+    flat_no: str,
+    month_year: str,
+    details: dict,
+    society_id: str | None = None,
+    timeout: float = 10,
+) -> dict:
+    return call(
+        "audit-service",
+        "POST",
+        "/log_event",
+        body=_scoped(
+            {
+                "event_type": event_type,
+                "flat_no": flat_no,
+                "month_year": month_year,
+                "details": details,
+            },
+            society_id,
+        ),
+        timeout=timeout,
+    )
+
+
+def chat(model: str, messages: list[dict], timeout: float = 30) -> dict:
+    return call("llm", "POST", "/api/chat", body={"model": model, "messages": messages}, timeout=timeout)
+
+
+def chat_batch(model: str, items: list[dict], timeout: float = 60) -> dict:
+    """`items` are {"id": ..., "messages": [...]}; results come back in the same order."""
+    return call("llm", "POST", "/api/chat/batch", body={"model": model, "requests": items}, timeout=timeout)
@@ -0,0 +1,216 @@
+"""
+In-memory prefix index over flats, kept warm by Postgres change notifications.
+
+`db/init.sql` installs a trigger that sends `NOTIFY flats_changed` with a
+{"society_id", "flat_no"} JSON payload on every insert/update/delete. There is
+one index per shard. It loads the shard's directory once, then a background
+thread LISTENs on that channel and refreshes single rows, so prefix lookups
+never touch the database. Without the trigger (a database that predates it and
+has not run db/migrate.sql) the index stays not ready. Fuzzy matching stays in
+Postgres (pg_trgm).
+"""
+import json
+import re
+import select
+import threading
+import time
+from bisect import bisect_left, insort
+
+import psycopg2
+
+NOTIFY_CHANNEL = "flats_changed"
+
+# words that show up in requests like "the Das family" or "Rajesh's flat"
+# but never identify a flat
+_STOPWORDS = {"the", "flat", "flats", "family", "of", "owner", "apartment", "mr", "mrs", "ms"}
+
+_FLAT_COLUMNS = "flat_no, owner_name, phone_number, whatsapp_number, society_id"
+
+
+def query_terms(q: str) -> list[str]:
+    """Lower-cased search terms with possessives and filler words removed."""
+    q = q.lower().replace("\u2019", "'").replace("\u02bc", "'")  # typographic apostrophes
+    words = re.findall(r"[a-z0-9][a-z0-9-]*", re.sub(r"'s\b", "", q))
+    return [w for w in words if w not in _STOPWORDS]
+
+
+def row_to_flat(row) -> dict:
+    return {
+        "flat_no": row[0],
+        "owner_name": row[1],
+        "phone_number": row[2],
+        "whatsapp_number": row[3],
+        "society_id": row[4],
+    }
+
+
+def _keys_for(flat: dict) -> set[str]:
+    flat_no = flat["flat_no"].lower()
+    keys = {flat_no, flat_no.replace("-", "")}
+    owner = (flat.get("owner_name") or "").lower()
+    keys.update(re.findall(r"[a-z0-9]+", owner))
+    return keys
+
+
+def match_score(flat: dict, terms: list[str]) -> float | None:
+    """
+    How well a flat matches: every term must start its number or a word of the
+    owner's name. A whole-word hit counts 1 and a prefix hit 0.5; the score is
+    the average over terms. None when some term does not match.
+    """
+    keys = _keys_for(flat)
+    total = 0.0
+    for term in terms:
+        hit = max((1.0 if key == term else 0.5 for key in keys if key.startswith(term)), default=0.0)
+        if not hit:
+            return None
+        total += hit
+    return round(total / len(terms), 3)
+
+
+def prefix_conditions(terms: list[str]) -> tuple[str, list[str]]:
+    """
+    SQL conditions (and params) selecting the candidates of match_score: each
+    term prefixes flat_no (with or without the dash) or a word of owner_name.
+    Each branch matches a trigram index in db/init.sql, so Postgres can combine
+    them instead of scanning flats.
+    """
+    clauses, params = [], []
+    for term in terms:
+        clauses.append("(flat_no ILIKE %s OR replace(flat_no, '-', '') ILIKE %s OR owner_name ~* %s)")
+        # terms are [a-z0-9-] only, so they are safe inside LIKE and regex patterns
+        params += [f"{term}%", f"{term}%", f"(^|[^a-z0-9]){term}"]
+    return " AND ".join(clauses), params
+
+
+class FlatSearchIndex:
+    def __init__(self, connect, reconnect_delay: float = 5.0):
+        self._connect = connect
+        self._reconnect_delay = reconnect_delay
+        self._lock = threading.Lock()
+        self._flats: dict[tuple[str, str], dict] = {}  # (society_id, flat_no) -> flat
+        self._keys: list[tuple[str, str, str]] = []  # sorted (society_id, key, flat_no)
+        self._thread: threading.Thread | None = None
+        self.ready = False
+
+    def ensure_started(self) -> None:
+        """Start the listener on first use (mounted sub-apps get no startup event)."""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._listen_forever, name="flat-index", daemon=True)
+                self._thread.start()
+
+    def _put(self, flat: dict) -> None:
+        society_id, flat_no = flat["society_id"], flat["flat_no"]
+        self._drop(society_id, flat_no)
+        self._flats[(society_id, flat_no)] = flat
+        for key in _keys_for(flat):
+            insort(self._keys, (society_id, key, flat_no))
+
+    def _drop(self, society_id: str, flat_no: str) -> None:
+        old = self._flats.pop((society_id, flat_no), None)
+        if old is None:
+            return
+        for key in _keys_for(old):
+            entry = (society_id, key, flat_no)
+            i = bisect_left(self._keys, entry)
+            if i < len(self._keys) and self._keys[i] == entry:
+                del self._keys[i]
+
+    @staticmethod
+    def _trigger_installed(conn) -> bool:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT 1 FROM pg_trigger WHERE tgrelid = to_regclass('flats') AND tgname = %s",
+            (NOTIFY_CHANNEL,),
+        )
+        return cur.fetchone() is not None
+
+    def _load_all(self, conn) -> None:
+        cur = conn.cursor()
+        cur.execute(f"SELECT {_FLAT_COLUMNS} FROM flats")
+        flats = [row_to_flat(r) for r in cur.fetchall()]
+        keys = sorted((f["society_id"], key, f["flat_no"]) for f in flats for key in _keys_for(f))
+        with self._lock:
+            self._flats = {(f["society_id"], f["flat_no"]): f for f in flats}
+            self._keys = keys
+
+    def _refresh(self, conn, payload: str) -> None:
+        try:
+            changed = json.loads(payload)
+            society_id, flat_no = changed["society_id"], changed["flat_no"]
+        except (ValueError, KeyError, TypeError):
+            return
+        cur = conn.cursor()
+        cur.execute(
+            f"SELECT {_FLAT_COLUMNS} FROM flats WHERE society_id = %s AND flat_no = %s",
+            (society_id, flat_no),
+        )
+        row = cur.fetchone()
+        with self._lock:
+            if row:
+                self._put(row_to_flat(row))
+            else:
+                self._drop(society_id, flat_no)
+
+    def _listen_forever(self) -> None:
+        while True:
+            conn = None
+            try:
+                conn = self._connect()
+                conn.autocommit = True
+                conn.cursor().execute(f"LISTEN {NOTIFY_CHANNEL}")
+                if not self._trigger_installed(conn):
+                    # nothing would ever announce a change, so the index would go
+                    # stale; serve from the DB and look again after the delay
+                    # (db/migrate.sql installs the trigger on older databases)
+                    self.ready = False
+                else:
+                    # listen first, then load, so no change can fall between the two
+                    self._load_all(conn)
+                    self.ready = True
+                    while True:
+                        if select.select([conn], [], [], 30) == ([], [], []):
+                            continue
+                        conn.poll()
+                        while conn.notifies:
+                            self._refresh(conn, conn.notifies.pop(0).payload)
+            except psycopg2.Error:
+                # notifications may have been missed; serve from the DB until reloaded
+                self.ready = False
+            finally:
+                if conn is not None:
+                    conn.close()
+            time.sleep(self._reconnect_delay)
+
+    def prefix_search(self, q: str, society_id: str, limit: int = 10) -> list[dict]:
+        """
+        Flats of one society matched by every query term, scored as match_score
+        does, best first. Empty when no flat matches all terms.
+        """
+        terms = query_terms(q)
+        if not terms:
+            return []
+        scores: dict[str, float] | None = None
+        with self._lock:
+            for term in terms:
+                hits: dict[str, float] = {}
+                i = bisect_left(self._keys, (society_id, term, ""))
+                while i < len(self._keys) and self._keys[i][0] == society_id and self._keys[i][1].startswith(term):
+                    _, key, flat_no = self._keys[i]
+                    hits[flat_no] = max(hits.get(flat_no, 0.0), 1.0 if key == term else 0.5)
+                    i += 1
+                # keep only flats that every term so far has hit
+                if scores is None:
+                    scores = hits
+                else:
+                    scores = {flat_no: score + hits[flat_no] for flat_no, score in scores.items() if flat_no in hits}
+                if not scores:
+                    return []
+            ranked = sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))[:limit]
+            return [
+                {**self._flats[(society_id, flat_no)], "score": round(score / len(terms), 3), "match": "prefix"}
+                for flat_no, score in ranked
+            ]
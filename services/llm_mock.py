@@ -1,12 +1,15 @@
 import json
 import re
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 
 from fastapi import FastAPI
 from pydantic import BaseModel
 
+from services.tracing import instrument, span
+
 app = FastAPI(title="LLM Mock", version="0.1.0")
+instrument(app, "llm")
 
 
 class ChatMessage(BaseModel):
@@ -19,6 +22,16 @@ class ChatRequest(BaseModel):
     messages: List[ChatMessage]
 
 
+class BatchItem(BaseModel):
+    id: Optional[str] = None
+    messages: List[ChatMessage]
+
+
+class BatchChatRequest(BaseModel):
+    model: str
+    requests: List[BatchItem]
+
+
 def _detect_flat_no(text: str) -> str:
     match = re.search(r"\b[A-Z]-\d{3}\b", text.upper())
     return match.group(0) if match else "C-101"
@@ -106,12 +119,14 @@ def _explain_from_context(user_prompt: str) -> str:
     return status_line + reminder_line + audit_line
 
 
-@app.post("/api/chat")
-def chat(req: ChatRequest):
-    system_prompt = req.messages[0].content if req.messages else ""
-    user_prompt = req.messages[-1].content if req.messages else ""
+def _is_planner(messages: List[ChatMessage]) -> bool:
+    return bool(messages) and "MaintenancePlanner" in messages[0].content
+
 
-    if "MaintenancePlanner" in system_prompt:
+def _respond(messages: List[ChatMessage]) -> dict:
+    user_prompt = messages[-1].content if messages else ""
+
+    if _is_planner(messages):
         plan = _build_plan(user_prompt)
         content = f"I'll handle it. Here's the plan: {json.dumps(plan)}"
     else:
@@ -121,3 +136,19 @@ def chat(req: ChatRequest):
         "message": {"role": "assistant", "content": content},
         "done": True,
     }
+
+
+@app.post("/api/chat")
+def chat(req: ChatRequest):
+    with span("llm.plan" if _is_planner(req.messages) else "llm.explain"):
+        return _respond(req.messages)
+
+
+@app.post("/api/chat/batch")
+def chat_batch(req: BatchChatRequest):
+    """Answer many independent chats in one round trip; results keep request order."""
+    with span("llm.batch", size=len(req.requests)):
+        return {
+            "results": [{"id": item.id, **_respond(item.messages)} for item in req.requests],
+            "done": True,
+        }
@@ -1,19 +1,32 @@
-from fastapi import FastAPI, HTTPException
+from typing import Annotated
+
+from fastapi import FastAPI, HTTPException, Query
 from pydantic import BaseModel
 import psycopg2
-import os
+
+from services import shards
+from services.flat_search import FlatSearchIndex, match_score, prefix_conditions, query_terms, row_to_flat
+from services.shards import DEFAULT_SOCIETY
+from services.client import published_breaker_states
+from services.tracing import instrument, span
 
 app = FastAPI(title="Payments Service")
+instrument(app, "payments-service")
+app.add_exception_handler(shards.ShardUnavailable, shards.shard_unavailable_response)
 
+# cap on rows scored by the database prefix path while the index warms up
+PREFIX_CANDIDATES = 500
 
-def get_conn():
-    return psycopg2.connect(
-        dbname=os.getenv("POSTGRES_DB", "maintdb"),
-        user=os.getenv("POSTGRES_USER", "maintuser"),
-        password=os.getenv("POSTGRES_PASSWORD", "maintpass"),
-        host=os.getenv("POSTGRES_HOST", "db"),
-        port=5432,
-    )
+# one in-memory search index per shard, created on first search
+_flat_indexes: dict[str, FlatSearchIndex] = {}
+
+
+def flat_index(shard: str) -> FlatSearchIndex:
+    index = _flat_indexes.get(shard)
+    if index is None:
+        index = _flat_indexes.setdefault(shard, FlatSearchIndex(lambda: shards.connect(shard)))
+    index.ensure_started()
+    return index
 
 
 class FlatCreate(BaseModel):
@@ -21,90 +34,199 @@ class FlatCreate(BaseModel):
     owner_name: str | None = None
     phone_number: str | None = None
     whatsapp_number: str | None = None
+    society_id: str = DEFAULT_SOCIETY
 
 
 @app.get("/health")
 def health():
-    return {"status": "ok"}
+    return {"status": "ok", "shards": sorted(shards.SHARDS), "breakers": published_breaker_states()}
 
 
 @app.get("/get_payment_status")
-def get_payment_status(flat_no: str, month_year: str):
-    conn = get_conn()
-    try:
+def get_payment_status(flat_no: str, month_year: str, society_id: str = DEFAULT_SOCIETY):
+    with shards.connection(society_id) as conn:
         cur = conn.cursor()
-        cur.execute(
-            """
-            SELECT mp.is_paid, mp.paid_on
-            FROM maintenance_payments mp
-            JOIN flats f ON f.flat_id = mp.flat_id
-            WHERE f.flat_no = %s AND mp.month_year = %s
-            """,
-            (flat_no, month_year),
-        )
-        row = cur.fetchone()
+        with span("db.select_payment"):
+            cur.execute(
+                """
+                SELECT mp.is_paid, mp.paid_on
+                FROM maintenance_payments mp
+                JOIN flats f ON f.flat_id = mp.flat_id
+                WHERE f.society_id = %s AND f.flat_no = %s AND mp.month_year = %s
+                """,
+                (society_id, flat_no, month_year),
+            )
+            row = cur.fetchone()
         if not row:
             raise HTTPException(status_code=404, detail="No payment record found")
 
         is_paid, paid_on = row
         return {
+            "society_id": society_id,
             "flat_no": flat_no,
             "month_year": month_year,
             "is_paid": is_paid,
             "paid_on": paid_on.isoformat() if paid_on else None,
         }
-    finally:
-        conn.close()
 
 
 @app.post("/add_flat")
 def add_flat(flat: FlatCreate):
-    conn = get_conn()
-    try:
-        cur = conn.cursor()
-        cur.execute(
-            """
-            INSERT INTO flats (flat_no, owner_name, phone_number, whatsapp_number)
-            VALUES (%s, %s, %s, %s)
-            ON CONFLICT (flat_no) DO UPDATE SET
-                owner_name = EXCLUDED.owner_name,
-                phone_number = EXCLUDED.phone_number,
-                whatsapp_number = EXCLUDED.whatsapp_number
-            RETURNING flat_id
-            """,
-            (flat.flat_no, flat.owner_name, flat.phone_number, flat.whatsapp_number),
-        )
-        flat_id = cur.fetchone()[0]
-        conn.commit()
-        return {"status": "OK", "flat_id": flat_id, "flat_no": flat.flat_no}
-    except psycopg2.Error as e:
-        conn.rollback()
-        raise HTTPException(status_code=400, detail=f"DB error: {e.pgerror or str(e)}")
-    finally:
-        conn.close()
+    with shards.connection(flat.society_id) as conn:
+        try:
+            cur = conn.cursor()
+            with span("db.upsert_flat"):
+                cur.execute(
+                    """
+                    INSERT INTO flats (society_id, flat_no, owner_name, phone_number, whatsapp_number)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON CONFLICT (society_id, flat_no) DO UPDATE SET
+                        owner_name = EXCLUDED.owner_name,
+                        phone_number = EXCLUDED.phone_number,
+                        whatsapp_number = EXCLUDED.whatsapp_number
+                    RETURNING flat_id
+                    """,
+                    (flat.society_id, flat.flat_no, flat.owner_name, flat.phone_number, flat.whatsapp_number),
+                )
+                flat_id = cur.fetchone()[0]
+                conn.commit()
+            return {"status": "OK", "flat_id": flat_id, "flat_no": flat.flat_no, "society_id": flat.society_id}
+        except psycopg2.errors.QueryCanceled:
+            # out of time, not bad input; let the caller see it as such
+            conn.rollback()
+            raise
+        except psycopg2.Error as e:
+            conn.rollback()
+            raise HTTPException(status_code=400, detail=f"DB error: {e.pgerror or str(e)}")
 
 
 @app.get("/list_flats")
-def list_flats():
-    conn = get_conn()
-    try:
+def list_flats(society_id: str = DEFAULT_SOCIETY):
+    with shards.connection(society_id) as conn:
+        cur = conn.cursor()
+        with span("db.list_flats"):
+            cur.execute(
+                """
+                SELECT flat_no, owner_name, phone_number, whatsapp_number, society_id
+                FROM flats
+                WHERE society_id = %s
+                ORDER BY flat_no
+                """,
+                (society_id,),
+            )
+            rows = cur.fetchall()
+        return [row_to_flat(r) for r in rows]
+
+
+@app.get("/search_flats")
+def search_flats(q: str, limit: int = 10, society_id: str = DEFAULT_SOCIETY):
+    """
+    Prefix matches on flat_no / owner name words, served from the in-memory index;
+    every term has to match. Only when no flat matches all terms does the query
+    fall back to pg_trgm fuzzy matching in Postgres ("Rajsh" -> "Rajesh Kumar Das").
+    """
+    limit = max(1, min(limit, 50))
+    terms = query_terms(q)
+    if not terms:
+        return {"query": q, "source": "none", "results": []}
+
+    index = flat_index(shards.shard_for(society_id))
+    if index.ready:
+        with span("index.prefix_search"):
+            results = index.prefix_search(q, society_id, limit)
+        source = "memory"
+        if results:
+            return {"query": q, "source": source, "results": results}
+    else:
+        results = []
+        source = "db"
+
+    cleaned = " ".join(terms)
+    with shards.connection(society_id) as conn:
         cur = conn.cursor()
-        cur.execute(
-            """
-            SELECT flat_no, owner_name, phone_number, whatsapp_number
-            FROM flats
-            ORDER BY flat_no
-            """
-        )
-        rows = cur.fetchall()
-        return [
-            {
-                "flat_no": r[0],
-                "owner_name": r[1],
-                "phone_number": r[2],
-                "whatsapp_number": r[3],
-            }
-            for r in rows
-        ]
-    finally:
-        conn.close()
+        if source == "db":
+            # index still warming up: the same per-term prefix match, scored like
+            # the index does. Every branch of prefix_conditions has a trigram index
+            # (flat_no, flat_no without the dash, owner_name); terms shorter than
+            # three characters have no trigrams and still scan the society's rows.
+            conditions, params = prefix_conditions(terms)
+            with span("db.prefix_search"):
+                cur.execute(
+                    f"""
+                    SELECT flat_no, owner_name, phone_number, whatsapp_number, society_id
+                    FROM flats
+                    WHERE society_id = %s AND {conditions}
+                    ORDER BY flat_no
+                    LIMIT %s
+                    """,
+                    (society_id, *params, PREFIX_CANDIDATES),
+                )
+                scored = [(match_score(flat, terms), flat) for flat in map(row_to_flat, cur.fetchall())]
+            scored = sorted(((s, f) for s, f in scored if s is not None), key=lambda sf: (-sf[0], sf[1]["flat_no"]))
+            results = [{**flat, "score": score, "match": "prefix"} for score, flat in scored[:limit]]
+            if results:
+                return {"query": q, "source": source, "results": results}
+
+        with span("db.fuzzy_search"):
+            cur.execute(
+                """
+                SELECT flat_no, owner_name, phone_number, whatsapp_number, society_id,
+                       GREATEST(similarity(flat_no, %s), word_similarity(%s, coalesce(owner_name, ''))) AS score
+                FROM flats
+                WHERE society_id = %s AND (flat_no %% %s OR %s <%% owner_name)
+                ORDER BY score DESC, flat_no
+                LIMIT %s
+                """,
+                (cleaned, cleaned, society_id, cleaned, cleaned, limit),
+            )
+            results = [
+                {**row_to_flat(r), "score": round(float(r[5]), 3), "match": "fuzzy"} for r in cur.fetchall()
+            ]
+        return {"query": q, "source": "db", "results": results}
+
+
+def _shard_payment_summary(shard: str, month_year: str, society_ids: list[str] | None) -> list[tuple]:
+    with shards.connection(shard=shard) as conn:
+        cur = conn.cursor()
+        with span("db.payment_summary", shard=shard):
+            cur.execute(
+                """
+                SELECT f.society_id,
+                       COUNT(*) AS billed,
+                       COUNT(*) FILTER (WHERE mp.is_paid) AS paid
+                FROM maintenance_payments mp
+                JOIN flats f ON f.flat_id = mp.flat_id
+                WHERE mp.month_year = %s AND (%s::text[] IS NULL OR f.society_id = ANY(%s::text[]))
+                GROUP BY f.society_id
+                """,
+                (month_year, society_ids, society_ids),
+            )
+            return cur.fetchall()
+
+
+@app.get("/payment_summary")
+def payment_summary(month_year: str, society_id: Annotated[list[str] | None, Query()] = None):
+    """Paid/unpaid counts per society for a month, fanned out over the shards in parallel."""
+    targets = shards.shards_for(society_id)
+    results, errors = shards.fan_out(
+        lambda shard: _shard_payment_summary(shard, month_year, society_id),
+        targets,
+    )
+    societies = []
+    for shard, rows in results.items():
+        for society, billed, paid in rows:
+            # a society moved between shards may still have rows on the old one
+            if shards.shard_for(society) != shard:
+                continue
+            societies.append({"society_id": society, "billed": billed, "paid": paid, "unpaid": billed - paid})
+    societies.sort(key=lambda s: s["society_id"])
+    return {
+        "month_year": month_year,
+        "totals": {
+            "billed": sum(s["billed"] for s in societies),
+            "paid": sum(s["paid"] for s in societies),
+            "unpaid": sum(s["unpaid"] for s in societies),
+        },
+        "societies": societies,
+        "shard_errors": errors,
+    }
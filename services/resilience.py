@@ -0,0 +1,158 @@
+"""
+Deadline budgets, circuit breakers and hedged reads for downstream calls.
+
+A request opens a `deadline(seconds)`; each step inside it can take a `step(share)`
+of whatever time is left, so slack from a fast step rolls over to later ones.
+services.client caps every call's timeout at the remaining budget, fails fast
+through a per-service `CircuitBreaker`, and can `hedged()` idempotent reads.
+"""
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "20"))
+# LLM calls are slow (a local llama3 easily takes tens of seconds) and run
+# outside the request deadline, each bounded by this instead
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+# 0 disables hedging; otherwise a second copy of an idempotent read is sent
+# when the first has not answered after this many milliseconds
+HEDGE_AFTER_MS = float(os.getenv("HEDGE_AFTER_MS", "0"))
+
+# absolute time.monotonic() at which the current request must be done
+_expires_at: contextvars.ContextVar[float | None] = contextvars.ContextVar("deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds: float = REQUEST_DEADLINE_SECONDS):
+    """Bound everything inside to `seconds`, never extending an outer deadline."""
+    expires = time.monotonic() + seconds
+    outer = _expires_at.get()
+    if outer is not None:
+        expires = min(expires, outer)
+    token = _expires_at.set(expires)
+    try:
+        yield
+    finally:
+        _expires_at.reset(token)
+
+
+@contextmanager
+def step(share: float):
+    """Give the enclosed step `share` of the time left in the current deadline."""
+    left = remaining()
+    if left is None:
+        yield
+        return
+    with deadline(max(left, 0.0) * share):
+        yield
+
+
+def remaining() -> float | None:
+    """Seconds left in the current deadline, or None when there is none."""
+    expires = _expires_at.get()
+    if expires is None:
+        return None
+    return expires - time.monotonic()
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure breaker: `closed` until `failure_threshold` failures in a
+    row, then `open` (calls fail fast) for `reset_timeout` seconds, then
+    `half_open` where a single trial call decides whether to close again.
+    `on_change()` is called whenever the state or failure count changes.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = BREAKER_FAILURES,
+        reset_timeout: float = BREAKER_RESET_SECONDS,
+        on_change=None,
+    ):
+        self.name = name
+        self.on_change = on_change
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def _changed(self, before: tuple) -> None:
+        if self.on_change is not None and before != (self.state, self.failures):
+            self.on_change()
+
+    def allow(self) -> bool:
+        with self._lock:
+            before = (self.state, self.failures)
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+            allowed = self.state == "half_open" and not self._trial_in_flight
+            if allowed:
+                self._trial_in_flight = True
+        self._changed(before)
+        return allowed
+
+    def record_success(self) -> None:
+        with self._lock:
+            before = (self.state, self.failures)
+            self.state = "closed"
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+        self._changed(before)
+
+    def record_abandoned(self) -> None:
+        """The call gave up for the caller's own reasons; say nothing about the service."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            before = (self.state, self.failures)
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+        self._changed(before)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            info = {"state": self.state, "consecutive_failures": self.failures}
+            if self.opened_at is not None:
+                info["retry_in_s"] = round(max(self.reset_timeout - (time.monotonic() - self.opened_at), 0.0), 1)
+            return info
+
+
+_hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="hedge")
+
+
+def hedged(fn, delay: float):
+    """
+    Run `fn()`; if it has not returned after `delay` seconds, race a second copy
+    and return whichever succeeds first. Only use for idempotent reads.
+    """
+    first = _hedge_pool.submit(contextvars.copy_context().run, fn)
+    done, _ = wait([first], timeout=delay)
+    if done:
+        return first.result()
+
+    pending = {first, _hedge_pool.submit(contextvars.copy_context().run, fn)}
+    error: BaseException | None = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for fut in done:
+            if fut.exception() is None:
+                return fut.result()
+            error = fut.exception()
+    raise error
@@ -0,0 +1,196 @@
+"""
+Society -> database shard routing, with one connection pool per shard.
+
+The shard map comes from SHARD_MAP (inline JSON) or SHARD_MAP_FILE (a path):
+
+    {
+      "default_shard": "main",
+      "shards": {
+        "main": {"host": "db"},
+        "east": {"host": "db-east", "dbname": "maintdb"}
+      },
+      "societies": {"green-acres": "east"}
+    }
+
+Missing shard settings fall back to the POSTGRES_* variables. Societies that
+are not listed go to default_shard. Without a map there is a single shard,
+"default", built from POSTGRES_*, so single-society installs keep working.
+"""
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from contextvars import copy_context
+
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+
+from services.resilience import deadline, remaining
+from services.tracing import span
+
+DEFAULT_SOCIETY = os.getenv("DEFAULT_SOCIETY_ID", "default")
+POOL_MAX = int(os.getenv("SHARD_POOL_MAX", "10"))
+CONNECT_TIMEOUT = int(os.getenv("POSTGRES_CONNECT_TIMEOUT", "5"))
+# per-shard bound for fan_out when the caller has no request deadline
+SHARD_TIMEOUT_SECONDS = float(os.getenv("SHARD_TIMEOUT_SECONDS", "10"))
+
+
+def _base_params() -> dict:
+    return {
+        "dbname": os.getenv("POSTGRES_DB", "maintdb"),
+        "user": os.getenv("POSTGRES_USER", "maintuser"),
+        "password": os.getenv("POSTGRES_PASSWORD", "maintpass"),
+        "host": os.getenv("POSTGRES_HOST", "db"),
+        "port": 5432,
+        "connect_timeout": CONNECT_TIMEOUT,
+    }
+
+
+def _load_map() -> dict:
+    raw = os.getenv("SHARD_MAP")
+    path = os.getenv("SHARD_MAP_FILE")
+    if not raw and path:
+        with open(path, encoding="utf-8") as fh:
+            raw = fh.read()
+    if not raw:
+        return {"default_shard": "default", "shards": {"default": {}}, "societies": {}}
+    return json.loads(raw)
+
+
+_map = _load_map()
+SHARDS: dict[str, dict] = {name: {**_base_params(), **cfg} for name, cfg in _map["shards"].items()}
+SOCIETY_SHARDS: dict[str, str] = dict(_map.get("societies", {}))
+DEFAULT_SHARD: str = _map.get("default_shard") or next(iter(SHARDS))
+
+for _society, _shard in SOCIETY_SHARDS.items():
+    if _shard not in SHARDS:
+        raise ValueError(f"shard map sends society {_society!r} to unknown shard {_shard!r}")
+
+
+class ShardUnavailable(Exception):
+    """A shard's database cannot be reached. Services answer 503 with the shard's name."""
+
+    def __init__(self, shard: str, reason):
+        super().__init__(f"shard {shard!r} unavailable: {str(reason).strip()}")
+        self.shard = shard
+
+
+def shard_unavailable_response(request, ex: ShardUnavailable):
+    """FastAPI exception handler: callers can tell one bad shard from a failing service."""
+    from fastapi.responses import JSONResponse
+
+    return JSONResponse(status_code=503, content={"detail": str(ex), "shard": ex.shard})
+
+
+def shard_for(society_id: str) -> str:
+    return SOCIETY_SHARDS.get(society_id, DEFAULT_SHARD)
+
+
+def shards_for(society_ids: list[str] | None) -> list[str]:
+    """Shards holding the given societies, or every shard when None."""
+    if society_ids is None:
+        return list(SHARDS)
+    return sorted({shard_for(s) for s in society_ids})
+
+
+def connect(shard: str):
+    """A fresh, unpooled connection, for long-lived uses such as LISTEN."""
+    return psycopg2.connect(**SHARDS[shard])
+
+
+class _ShardPool:
+    # ThreadedConnectionPool raises instead of waiting when it runs dry;
+    # the semaphore makes callers queue for a free connection instead.
+    def __init__(self, params: dict):
+        self.pool = ThreadedConnectionPool(0, POOL_MAX, **params)
+        self.slots = threading.BoundedSemaphore(POOL_MAX)
+
+
+_pools: dict[str, _ShardPool] = {}
+_pools_lock = threading.Lock()
+
+
+def _pool(shard: str) -> _ShardPool:
+    pool = _pools.get(shard)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(shard)
+            if pool is None:
+                pool = _pools[shard] = _ShardPool(SHARDS[shard])
+    return pool
+
+
+@contextmanager
+def connection(society_id: str | None = None, shard: str | None = None):
+    """
+    Borrow a pooled connection to the shard of `society_id` (or `shard`).
+
+    Inside a request deadline, waiting for a free connection is bounded by the
+    time left and so is the borrower's transaction (SET LOCAL statement_timeout);
+    the server cancels a query that would outlive the caller.
+    """
+    shard = shard or shard_for(society_id or DEFAULT_SOCIETY)
+    pool = _pool(shard)
+    left = remaining()
+    with span("db.connect", shard=shard):
+        if not pool.slots.acquire(timeout=max(left, 0.0) if left is not None else None):
+            raise TimeoutError(f"no free connection to shard {shard!r} within the request deadline")
+        try:
+            conn = pool.pool.getconn()
+        except psycopg2.OperationalError as ex:
+            pool.slots.release()
+            raise ShardUnavailable(shard, ex) from ex
+        except Exception:
+            pool.slots.release()
+            raise
+        left = remaining()
+        if left is not None:
+            try:
+                conn.cursor().execute("SET LOCAL statement_timeout = %s", (max(int(left * 1000), 1),))
+            except Exception:
+                pool.pool.putconn(conn, close=True)
+                pool.slots.release()
+                raise
+    try:
+        yield conn
+    except psycopg2.OperationalError as ex:
+        # the server went away mid-request (a statement timeout leaves it open)
+        if conn.closed:
+            raise ShardUnavailable(shard, ex) from ex
+        raise
+    finally:
+        # the pool rolls back anything left open and drops broken connections
+        pool.pool.putconn(conn, close=bool(conn.closed))
+        pool.slots.release()
+
+
+_fan_out_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="shard-fan-out")
+
+
+def fan_out(fn, shards: list[str]) -> tuple[dict, dict]:
+    """
+    Run `fn(shard)` on every shard in parallel, waiting at most for the time
+    left in the request deadline (or SHARD_TIMEOUT_SECONDS without one).
+    Returns ({shard: result}, {shard: error message}) so one bad or unreachable
+    shard only removes its own part of an aggregate.
+    """
+    left = remaining()
+    timeout = SHARD_TIMEOUT_SECONDS if left is None else max(left, 0.0)
+    # workers inherit the bound too, so their queries get a statement_timeout
+    with deadline(timeout):
+        futures = {shard: _fan_out_pool.submit(copy_context().run, fn, shard) for shard in shards}
+    wait(futures.values(), timeout=timeout)
+    results, errors = {}, {}
+    for shard, fut in futures.items():
+        if not fut.done():
+            # a worker stuck on the network finishes in the background; the
+            # aggregate goes out without that shard
+            fut.cancel()
+            errors[shard] = f"timed out after {timeout:.1f}s"
+            continue
+        try:
+            results[shard] = fut.result()
+        except Exception as ex:
+            errors[shard] = f"{type(ex).__name__}: {ex}"
+    return results, errors
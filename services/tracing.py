@@ -0,0 +1,247 @@
+"""
+Minimal request tracing shared by the services, the MCP server and the UI.
+
+A trace id travels between hops in the `X-Request-ID` header and the caller's
+span id in `X-Parent-Span-ID`. Every hop records spans with timings and, when
+`TRACE_FILE` is set, appends them as JSON lines to it (one span per line,
+OpenTelemetry-like field names so the file can be shipped to a collector as-is).
+Spans go through a bounded queue to a writer thread, so requests never wait on
+the file; when the queue is full, spans are dropped. Tracing is off by default.
+
+Print the critical path of a single trace:
+
+    python -m services.tracing show <request_id> [--file traces.jsonl ...]
+"""
+import argparse
+import atexit
+import contextvars
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+REQUEST_ID_HEADER = "X-Request-ID"
+PARENT_SPAN_HEADER = "X-Parent-Span-ID"
+
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+TRACE_QUEUE_SIZE = int(os.getenv("TRACE_QUEUE_SIZE", "10000"))
+
+# (trace_id, span_id, service) of the span currently open in this context
+_current: contextvars.ContextVar[tuple[str, str, str] | None] = contextvars.ContextVar(
+    "trace_context", default=None
+)
+_queue: queue.Queue = queue.Queue(maxsize=TRACE_QUEUE_SIZE)
+_writer_pid: int | None = None  # process that owns the writer thread (pool workers fork)
+_writer_lock = threading.Lock()
+dropped_spans = 0
+
+
+def _new_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def current_trace_id() -> str | None:
+    ctx = _current.get()
+    return ctx[0] if ctx else None
+
+
+def outgoing_headers() -> dict:
+    """Headers that carry the current trace context to the next hop."""
+    ctx = _current.get()
+    if not ctx:
+        return {}
+    return {REQUEST_ID_HEADER: ctx[0], PARENT_SPAN_HEADER: ctx[1]}
+
+
+def _write_forever() -> None:
+    while True:
+        batch = [_queue.get()]
+        while len(batch) < 500:
+            try:
+                batch.append(_queue.get_nowait())
+            except queue.Empty:
+                break
+        lines = "".join(json.dumps(record, default=str) + "\n" for record in batch)
+        try:
+            # reopened per batch, so the file can be rotated or removed underneath
+            with open(TRACE_FILE, "a", encoding="utf-8") as fh:
+                fh.write(lines)
+        except OSError:
+            # tracing must never break the requests it observes
+            pass
+        for _ in batch:
+            _queue.task_done()
+
+
+def _flush(timeout: float = 2.0) -> None:
+    # at exit, give the writer a moment to write what is queued
+    deadline_at = time.monotonic() + timeout
+    while _queue.unfinished_tasks and time.monotonic() < deadline_at:
+        time.sleep(0.01)
+
+
+def _ensure_writer() -> None:
+    global _writer_pid
+    if _writer_pid == os.getpid():
+        return
+    with _writer_lock:
+        if _writer_pid != os.getpid():
+            threading.Thread(target=_write_forever, name="trace-writer", daemon=True).start()
+            if _writer_pid is None:
+                atexit.register(_flush)
+            _writer_pid = os.getpid()
+
+
+def _export(record: dict) -> None:
+    global dropped_spans
+    if not TRACE_FILE:
+        return
+    _ensure_writer()
+    try:
+        _queue.put_nowait(record)
+    except queue.Full:
+        dropped_spans += 1
+
+
+@contextmanager
+def span(name: str, service: str | None = None, trace_id: str | None = None, parent_id: str | None = None, **attrs):
+    """Record a timed span; nests under the span already open in this context."""
+    ctx = _current.get()
+    if trace_id is None:
+        trace_id = ctx[0] if ctx else uuid.uuid4().hex
+    if parent_id is None and ctx and ctx[0] == trace_id:
+        parent_id = ctx[1]
+    if service is None:
+        service = ctx[2] if ctx else os.getenv("SERVICE_NAME", "unknown")
+
+    record = {
+        "trace_id": trace_id,
+        "span_id": _new_id(),
+        "parent_id": parent_id,
+        "name": name,
+        "service": service,
+        "start": time.time(),
+        "attributes": attrs,
+    }
+    token = _current.set((trace_id, record["span_id"], service))
+    started = time.perf_counter()
+    try:
+        yield record
+    except Exception as ex:
+        record["error"] = f"{type(ex).__name__}: {ex}"
+        raise
+    finally:
+        record["duration_ms"] = round((time.perf_counter() - started) * 1000, 3)
+        record["end"] = record["start"] + record["duration_ms"] / 1000
+        _current.reset(token)
+        _export(record)
+
+
+def instrument(app, service: str) -> None:
+    """Open a server span for every request handled by a FastAPI app."""
+
+    @app.middleware("http")
+    async def _trace_request(request, call_next):
+        trace_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+        parent_id = request.headers.get(PARENT_SPAN_HEADER)
+        with span(
+            f"{request.method} {request.url.path}",
+            service=service,
+            trace_id=trace_id,
+            parent_id=parent_id,
+        ) as rec:
+            response = await call_next(request)
+            rec["attributes"]["status_code"] = response.status_code
+        response.headers[REQUEST_ID_HEADER] = trace_id
+        return response
+
+
+def load_trace(trace_id: str, files: list[str]) -> list[dict]:
+    spans = []
+    for path in files:
+        try:
+            with open(path, encoding="utf-8") as fh:
+                for line in fh:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue
+                    if rec.get("trace_id") == trace_id:
+                        spans.append(rec)
+        except FileNotFoundError:
+            continue
+    return spans
+
+
+def critical_path(spans: list[dict]) -> list[tuple[int, dict]]:
+    """
+    Return (depth, span) pairs on the critical path of a trace.
+
+    Walking back from a span's end, the last child to finish is on the path;
+    the cursor then jumps to that child's start and the search repeats for
+    earlier, non-overlapping children.
+    """
+    by_id = {s["span_id"]: s for s in spans}
+    children: dict[str, list[dict]] = {}
+    roots = []
+    for s in spans:
+        if s.get("parent_id") in by_id:
+            children.setdefault(s["parent_id"], []).append(s)
+        else:
+            roots.append(s)
+
+    def walk(node: dict, depth: int) -> list[tuple[int, dict]]:
+        out = [(depth, node)]
+        cursor = node["end"]
+        chosen = []
+        for child in sorted(children.get(node["span_id"], []), key=lambda c: c["end"], reverse=True):
+            if child["end"] <= cursor + 1e-3:
+                chosen.append(child)
+                cursor = child["start"]
+        for child in reversed(chosen):
+            out.extend(walk(child, depth + 1))
+        return out
+
+    path = []
+    for root in sorted(roots, key=lambda r: r["start"]):
+        path.extend(walk(root, 0))
+    return path
+
+
+def _show(trace_id: str, files: list[str]) -> int:
+    spans = load_trace(trace_id, files)
+    if not spans:
+        print(f"No spans found for trace {trace_id} in {', '.join(files)}")
+        return 1
+    t0 = min(s["start"] for s in spans)
+    total_ms = (max(s["end"] for s in spans) - t0) * 1000
+    print(f"Trace {trace_id}: {len(spans)} spans, {total_ms:.1f} ms end-to-end")
+    print("Critical path:")
+    for depth, s in critical_path(spans):
+        offset_ms = (s["start"] - t0) * 1000
+        flag = "  !" + s["error"] if s.get("error") else ""
+        print(
+            f"  +{offset_ms:8.1f} ms {s['duration_ms']:9.1f} ms  "
+            f"{'  ' * depth}[{s['service']}] {s['name']}{flag}"
+        )
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Inspect recorded request traces.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    show = sub.add_parser("show", help="print the critical path of one trace")
+    show.add_argument("trace_id")
+    show.add_argument("--file", action="append", dest="files", help="span file(s); default TRACE_FILE")
+    args = parser.parse_args(argv)
+    return _show(args.trace_id, args.files or [TRACE_FILE])
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
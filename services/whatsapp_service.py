@@ -1,8 +1,13 @@
 from fastapi import FastAPI
 from pydantic import BaseModel
 from datetime import datetime
+import sys
+
+from services.client import published_breaker_states
+from services.tracing import instrument, span
 
 app = FastAPI(title="WhatsApp Service (Stub)")
+instrument(app, "whatsapp-service")
 
 
 class ReminderRequest(BaseModel):
@@ -12,17 +17,21 @@ class ReminderRequest(BaseModel):
 
 @app.get("/health")
 def health():
-    return {"status": "ok"}
+    return {"status": "ok", "breakers": published_breaker_states()}
 
 
 @app.post("/send_reminder")
 def send_reminder(req: ReminderRequest):
     # Stub: just simulate sending WhatsApp
-    message_id = f"local-whatsapp-{int(datetime.utcnow().timestamp())}"
-    print(
-        f"[STUB] Sending WhatsApp reminder for flat {req.flat_no} "
-        f"for {req.month_year}, message_id={message_id}"
-    )
+    with span("whatsapp.send", flat_no=req.flat_no):
+        message_id = f"local-whatsapp-{int(datetime.utcnow().timestamp())}"
+        # stderr, not stdout: in all-in-one mode this runs inside the MCP server,
+        # whose stdout is the stdio JSON-RPC channel
+        print(
+            f"[STUB] Sending WhatsApp reminder for flat {req.flat_no} "
+            f"for {req.month_year}, message_id={message_id}",
+            file=sys.stderr,
+        )
     return {
         "status": "SENT",
         "message_id": message_id,